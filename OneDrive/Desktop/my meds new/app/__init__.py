@@ -3,19 +3,29 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 from app.config import Config
-from app.models import db, User
+from app.database import init_database
+from app.hashing import PasswordHasher
+from app.identity import identity_cache, load_cached_user
+from app.instrumentation import get_metrics, init_instrumentation
 
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 bcrypt = Bcrypt()
+password_hasher = PasswordHasher(bcrypt)
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
-    db.init_app(app)
+    init_database(app)
+    # Before the blueprints, so its request hooks run first
+    init_instrumentation(app)
     login_manager.init_app(app)
     bcrypt.init_app(app)
+    password_hasher.init_app(app)
+    if get_metrics(app) is not None:
+        get_metrics(app).collectors.append(password_hasher.metric_lines)
+    identity_cache.ttl = app.config['USER_CACHE_TTL']
 
     # Import blueprints
     from app.auth import auth as auth_blueprint
@@ -34,15 +44,26 @@ def create_app(config_class=Config):
 
     from app.appointments import appointments as appointments_blueprint
     app.register_blueprint(appointments_blueprint)
+
+    from app.calendar_feed import calendar_feed as calendar_blueprint, feed_cache
+    app.register_blueprint(calendar_blueprint)
+    feed_cache.ttl = app.config['CALENDAR_CACHE_TTL']
+    feed_cache.max_size = app.config['CALENDAR_CACHE_SIZE']
     
-    with app.app_context():
-        db.create_all()
-        # Initialize scheduler here to avoid circular imports if possible, or in main
-        from app.reminders import start_scheduler
-        start_scheduler(app)
+    from app.commands import register_commands
+    register_commands(app)
+
+    if app.config['SCHEMA_AUTO_UPGRADE']:
+        from app.schema import upgrade_schema
+        with app.app_context():
+            upgrade_schema()
+
+    # Only starts anything under the dev server's reloader with REMINDER_SCHEDULER_IN_APP
+    from app.reminders import start_scheduler
+    start_scheduler(app)
 
     return app
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
\ No newline at end of file
+    return load_cached_user(int(user_id))
\ No newline at end of file
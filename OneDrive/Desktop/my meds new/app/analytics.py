@@ -0,0 +1,241 @@
+"""
+Vectorized adherence analytics: daily/weekly/monthly series, streaks and
+missed-dose heatmaps for one medicine or a whole cohort.
+
+Medicines become rows and days become columns of NumPy matrices of scheduled
+and taken doses; every aggregate is a sum over one of the axes. Days inside
+months already rolled up by app.retention have no per-day detail, so they are
+left out of day and week buckets and only count through monthly rollups.
+"""
+from datetime import datetime, time
+import numpy as np
+from app.models import db, DoseLog, DoseRollup, Medicine, User
+from app.utils import adherence_window_end
+
+BUCKETS = ('day', 'week', 'month')
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+DAY = np.timedelta64(1, 'D')
+COHORT_FIELDS = ['user_id', 'email', 'medicines', 'scheduled', 'taken', 'adherence', 'current_streak', 'longest_streak']
+
+def _day(moment):
+    return np.datetime64(moment.date(), 'D')
+
+def _moment(day):
+    return datetime.combine(day.astype(object), time())
+
+class DoseMatrix:
+    """
+    Scheduled and taken doses per (medicine, day) over [start, end] days.
+    Built from columnar arrays: one row per medicine, one entry per taken log.
+    """
+    def __init__(self, medicines, start, end, now=None):
+        now = now or datetime.utcnow()
+        self.medicines = medicines
+        self.today = _day(now)
+        self.start = _day(start)
+        self.days = np.arange(self.start, _day(end) + DAY)
+        window_end = datetime.combine(end.date(), datetime.max.time())
+        n = len(self.days)
+        m = len(medicines)
+
+        # Per-medicine columns: first day, last day and slots due on the last day
+        first = np.empty(m, dtype=np.int64)
+        last = np.empty(m, dtype=np.int64)
+        per_day = np.empty(m, dtype=np.int64)
+        partial = np.empty(m, dtype=np.int64)
+        archived = np.zeros(m, dtype=np.int64)
+        for i, med in enumerate(medicines):
+            slots = med.get_slot_minutes()
+            until = min(adherence_window_end(med, now), window_end)
+            per_day[i] = len(slots)
+            first[i] = (_day(med.start_date) - self.start) // DAY if med.start_date else n
+            last[i] = (_day(until) - self.start) // DAY
+            partial[i] = np.searchsorted(slots, until.hour * 60 + until.minute, side='right')
+
+        index = np.arange(n)
+        active = (index >= first[:, None]) & (index <= last[:, None])
+        self.scheduled = np.where(index < last[:, None], per_day[:, None], partial[:, None]) * active
+        self.taken = np.zeros((m, n), dtype=np.int64)
+        self.log_rows = np.zeros(0, dtype=np.int64)
+        self.log_when = np.zeros(0, dtype='datetime64[m]')
+
+        # Months rolled up by retention are a prefix of each medicine's history
+        self.rollups = {}
+        self.archived_until = [None] * m
+        if m:
+            row_of = {med.id: i for i, med in enumerate(medicines)}
+            for medicine_id, month, taken in db.session.query(
+                    DoseRollup.medicine_id, DoseRollup.month, DoseRollup.taken_count
+            ).filter(DoseRollup.medicine_id.in_(list(row_of))):
+                i = row_of[medicine_id]
+                self.rollups[(i, np.datetime64(month, 'M'))] = taken
+                month_end = (np.datetime64(month, 'M') + 1).astype('datetime64[D]')
+                archived[i] = max(archived[i], (month_end - self.start) // DAY)
+                self.archived_until[i] = max(self.archived_until[i] or month_end, month_end)
+        self.archived = index < archived[:, None]
+
+    def load_logs(self):
+        """Fill the taken matrix with one query over DoseLog."""
+        if not self.medicines:
+            return self
+        row_of = {med.id: i for i, med in enumerate(self.medicines)}
+        rows = db.session.query(DoseLog.medicine_id, DoseLog.scheduled_datetime).filter(
+            DoseLog.medicine_id.in_(list(row_of)),
+            DoseLog.taken == True,
+            DoseLog.scheduled_datetime >= _moment(self.start),
+            DoseLog.scheduled_datetime < _moment(self.days[-1] + DAY)
+        ).all()
+        rows_idx = np.fromiter((row_of[r[0]] for r in rows), dtype=np.int64, count=len(rows))
+        when = np.array([r[1] for r in rows], dtype='datetime64[m]')
+        self.add_logs(rows_idx, when)
+        return self
+
+    def add_logs(self, rows_idx, when):
+        """Count taken logs given as parallel arrays of matrix rows and minute timestamps."""
+        self.log_rows = rows_idx
+        self.log_when = when
+        m, n = self.taken.shape
+        day = (when.astype('datetime64[D]') - self.start) // DAY
+        inside = (day >= 0) & (day < n)
+        self.taken += np.bincount(rows_idx[inside] * n + day[inside], minlength=m * n).reshape(m, n)
+        return self
+
+    def series(self, bucket='day', rows=None):
+        """Scheduled and taken totals per bucket, summed over the given rows (default all)."""
+        rows = slice(None) if rows is None else rows
+        live = ~self.archived[rows]
+        if bucket == 'month':
+            live = np.ones_like(live)
+        scheduled = (self.scheduled[rows] * live).sum(axis=0)
+        taken = (np.minimum(self.taken[rows], self.scheduled[rows]) * live).sum(axis=0)
+
+        keys = self._bucket_keys(bucket)
+        periods, inverse = np.unique(keys, return_inverse=True)
+        scheduled = np.bincount(inverse, weights=scheduled, minlength=len(periods))
+        taken = np.bincount(inverse, weights=taken, minlength=len(periods))
+        if bucket == 'month':
+            selected = set(np.arange(len(self.medicines))[rows].tolist())
+            for (i, month), count in self.rollups.items():
+                position = np.searchsorted(periods, month.astype('datetime64[D]'))
+                if i in selected and position < len(periods) and periods[position] == month.astype('datetime64[D]'):
+                    taken[position] += count
+            taken = np.minimum(taken, scheduled)
+
+        adherence = np.round(taken / np.maximum(scheduled, 1) * 100, 1)
+        return [{
+            'period': period,
+            'scheduled': s,
+            'taken': t,
+            'adherence': a if s else None
+        } for period, s, t, a in zip(periods.astype(str).tolist(), scheduled.astype(np.int64).tolist(),
+                                     taken.astype(np.int64).tolist(), adherence.tolist())]
+
+    def _bucket_keys(self, bucket):
+        if bucket == 'week':
+            # Weeks start on Monday; 1970-01-01 was a Thursday
+            return self.days - (self.days.astype(np.int64) + 3) % 7 * DAY
+        if bucket == 'month':
+            return self.days.astype('datetime64[M]').astype('datetime64[D]')
+        return self.days
+
+    def streaks(self, rows=None):
+        """Current and longest runs of days on which every scheduled dose was taken."""
+        rows = slice(None) if rows is None else rows
+        live = ~self.archived[rows]
+        scheduled = (self.scheduled[rows] * live).sum(axis=0)
+        taken = (np.minimum(self.taken[rows], self.scheduled[rows]) * live).sum(axis=0)
+        due = scheduled > 0
+        complete = taken[due] >= scheduled[due]
+        if not complete.size:
+            return {'current': 0, 'longest': 0}
+
+        edges = np.diff(np.concatenate(([0], complete.astype(np.int8), [0])))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        longest = int((ends - starts).max()) if starts.size else 0
+        # A day still in progress does not break the current streak
+        if not complete[-1] and self.days[due][-1] == self.today:
+            complete = complete[:-1]
+        misses = np.flatnonzero(~complete)
+        current = complete.size - (misses[-1] + 1 if misses.size else 0)
+        return {'current': int(current), 'longest': longest}
+
+    def missed_by_slot(self, row=0):
+        """Missed doses of one medicine per (weekday, time slot), over days with full detail."""
+        med = self.medicines[row]
+        slots = np.array(med.get_slot_minutes(), dtype=np.int64)
+        heat = {'slots': ['%02d:%02d' % divmod(int(m), 60) for m in slots], 'weekdays': WEEKDAYS}
+        if not slots.size:
+            heat['missed'] = [[] for _ in WEEKDAYS]
+            return heat
+
+        weekday = (self.days.astype(np.int64) + 3) % 7
+        scheduled = self.scheduled[row] * ~self.archived[row]
+        full = scheduled == slots.size
+        expected = np.zeros((7, slots.size), dtype=np.int64)
+        expected += np.bincount(weekday[full], minlength=7)[:, None]
+        for day in np.flatnonzero((scheduled > 0) & ~full):
+            expected[weekday[day], :scheduled[day]] += 1
+
+        mine = self.log_rows == row
+        when = self.log_when[mine]
+        day = (when.astype('datetime64[D]') - self.start) // DAY
+        minute = ((when - when.astype('datetime64[D]')) // np.timedelta64(1, 'm')).astype(np.int64)
+        slot = np.searchsorted(slots, minute)
+        inside = (day >= 0) & (day < len(self.days))
+        on_slot = inside & (slot < slots.size)
+        on_slot[on_slot] &= slots[slot[on_slot]] == minute[on_slot]
+        on_slot[on_slot] &= ~self.archived[row][day[on_slot]]
+        # Several logs for the same dose count once
+        doses = np.unique(day[on_slot] * slots.size + slot[on_slot])
+        taken = np.bincount(weekday[doses // slots.size] * slots.size + doses % slots.size,
+                            minlength=7 * slots.size).reshape(7, slots.size)
+        heat['missed'] = np.clip(expected - taken, 0, None).tolist()
+        return heat
+
+def medicine_series(medicine, start, end, bucket='day', now=None):
+    """Series, streaks and missed-dose heatmap for one medicine."""
+    matrix = DoseMatrix([medicine], start, end, now).load_logs()
+    archived_until = matrix.archived_until[0]
+    return {
+        'medicine_id': medicine.id,
+        'bucket': bucket,
+        'start': str(matrix.days[0]),
+        'end': str(matrix.days[-1]),
+        'archived_until': str(archived_until) if archived_until is not None else None,
+        'series': matrix.series(bucket),
+        'streaks': matrix.streaks(),
+        'missed_by_slot': matrix.missed_by_slot(0)
+    }
+
+def cohort_report(start, end, user_ids=None, chunk_size=500, now=None):
+    """
+    Yield per-user adherence totals and streaks over [start, end], one
+    DoseMatrix per chunk of users so memory stays bounded.
+    """
+    query = db.session.query(User.id, User.email).order_by(User.id)
+    if user_ids is not None:
+        query = query.filter(User.id.in_(user_ids))
+    users = query.all()
+
+    for offset in range(0, len(users), chunk_size):
+        chunk = users[offset:offset + chunk_size]
+        meds = Medicine.query.filter(Medicine.user_id.in_([u.id for u in chunk])).order_by(Medicine.user_id).all()
+        matrix = DoseMatrix(meds, start, end, now).load_logs()
+        owners = np.array([m.user_id for m in meds], dtype=np.int64)
+        live = ~matrix.archived
+        scheduled = (matrix.scheduled * live).sum(axis=1)
+        taken = (np.minimum(matrix.taken, matrix.scheduled) * live).sum(axis=1)
+        for user_id, email in chunk:
+            rows = np.flatnonzero(owners == user_id)
+            s, t = int(scheduled[rows].sum()), int(taken[rows].sum())
+            streaks = matrix.streaks(rows)
+            yield {
+                'user_id': user_id,
+                'email': email,
+                'medicines': int(rows.size),
+                'scheduled': s,
+                'taken': t,
+                'adherence': round(t / s * 100, 1) if s else None,
+                'current_streak': streaks['current'],
+                'longest_streak': streaks['longest']
+            }
@@ -2,24 +2,94 @@ from flask import Blueprint, request, jsonify, render_template, abort
 from flask_login import login_required, current_user
 from app.models import Appointment, db
 from datetime import datetime, timedelta
+from operator import attrgetter
+from sqlalchemy import case, func, insert, select, tuple_
+from sqlalchemy.orm import aliased
+import base64
 
 appointments = Blueprint('appointments', __name__)
 
+DEFAULT_DURATION = timedelta(minutes=30)
+MAX_DURATION = timedelta(hours=12)
+MAX_BULK = 200
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
 @appointments.route('/appointments')
 @login_required
 def index():
-    # Show upcoming first
-    upcoming = Appointment.query.filter(
-        Appointment.user_id == current_user.id,
-        Appointment.appointment_datetime >= datetime.utcnow()
-    ).order_by(Appointment.appointment_datetime).all()
-    
-    past = Appointment.query.filter(
-        Appointment.user_id == current_user.id,
-        Appointment.appointment_datetime < datetime.utcnow()
-    ).order_by(Appointment.appointment_datetime.desc()).all()
+    # One query, split around a single timestamp: the next upcoming and the
+    # most recent past appointments, PAGE_SIZE of each
+    now = datetime.utcnow()
+    is_upcoming = Appointment.appointment_datetime >= now
+    rank = func.row_number().over(
+        partition_by=is_upcoming,
+        order_by=(case((is_upcoming, Appointment.appointment_datetime)).asc(), Appointment.appointment_datetime.desc())
+    ).label('rank')
+    ranked = select(Appointment, rank).where(Appointment.user_id == current_user.id).subquery()
+    appt = aliased(Appointment, ranked)
+    rows = db.session.query(appt).filter(ranked.c.rank <= PAGE_SIZE).all()
+
+    upcoming = sorted((a for a in rows if a.appointment_datetime >= now), key=attrgetter('appointment_datetime'))
+    past = sorted((a for a in rows if a.appointment_datetime < now), key=attrgetter('appointment_datetime'), reverse=True)
     
-    return render_template('appointments.html', upcoming=upcoming, past=past)
+    return render_template('appointment.html', upcoming=upcoming, past=past)
+
+def encode_cursor(appt):
+    raw = f"{appt.appointment_datetime.isoformat()}|{appt.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """(appointment_datetime, id) of the last row of the previous page."""
+    try:
+        dt_str, appt_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(dt_str), int(appt_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+def parse_appointment(data):
+    """
+    Validate one appointment payload. Returns (start, end) or raises ValueError.
+    End comes from 'end_datetime' or 'duration_minutes' (default 30 minutes).
+    """
+    if not data.get('title'):
+        raise ValueError('Title is required')
+    try:
+        start = datetime.strptime(data.get('datetime'), '%Y-%m-%dT%H:%M')
+        if data.get('end_datetime'):
+            end = datetime.strptime(data['end_datetime'], '%Y-%m-%dT%H:%M')
+        else:
+            end = start + timedelta(minutes=int(data.get('duration_minutes', 30)))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid date format')
+    if end <= start:
+        raise ValueError('Appointment must end after it starts')
+    if end - start > MAX_DURATION:
+        raise ValueError('Appointments can last at most 12 hours')
+    return start, end
+
+def existing_intervals(user_id, start, end):
+    """
+    (start, end, id) of the user's active appointments that may overlap
+    [start, end). Starts are bounded on both sides by MAX_DURATION, so this is
+    a range scan on the (user_id, appointment_datetime) index.
+    """
+    rows = db.session.query(
+        Appointment.appointment_datetime, Appointment.end_datetime, Appointment.id
+    ).filter(
+        Appointment.user_id == user_id,
+        Appointment.appointment_datetime > start - MAX_DURATION,
+        Appointment.appointment_datetime < end,
+        Appointment.status != 'cancelled'
+    ).order_by(Appointment.appointment_datetime).all()
+    # Appointments booked before end times existed last DEFAULT_DURATION
+    return [(s, e or s + DEFAULT_DURATION, i) for s, e, i in rows]
+
+def find_conflict(user_id, start, end):
+    for s, e, appt_id in existing_intervals(user_id, start, end):
+        if s < end and e > start:
+            return appt_id
+    return None
 
 @appointments.route('/api/appointments', methods=['GET', 'POST'])
 @login_required
@@ -27,48 +97,151 @@ def api_appointments():
     if request.method == 'POST':
         data = request.get_json()
         title = data.get('title')
-        dt_str = data.get('datetime')
         description = data.get('description', '')
         
         try:
-            appt_dt = datetime.strptime(dt_str, '%Y-%m-%dT%H:%M')
-        except ValueError:
-            return jsonify({'error': 'Invalid date format'}), 400
+            appt_dt, end_dt = parse_appointment(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
             
-        # Conflict detection: +/- 30 minutes
-        # Find any appointment where abs(appt_dt - existing.dt) < 30 mins
-        start_check = appt_dt - timedelta(minutes=29) # inclusive check might be strict, let's say < 30 mins
-        end_check = appt_dt + timedelta(minutes=29)
-        
-        conflict = Appointment.query.filter(
-            Appointment.user_id == current_user.id,
-            Appointment.status != 'cancelled',
-            Appointment.appointment_datetime >= start_check,
-            Appointment.appointment_datetime <= end_check
-        ).first()
-        
-        if conflict:
+        # Conflict detection: any active appointment whose interval overlaps [appt_dt, end_dt)
+        if find_conflict(current_user.id, appt_dt, end_dt):
             return jsonify({'error': 'Conflict: You have an overlapping appointment', 'code': 409}), 409
             
         new_appt = Appointment(
             user_id=current_user.id,
             title=title,
             description=description,
-            appointment_datetime=appt_dt
+            appointment_datetime=appt_dt,
+            end_datetime=end_dt
         )
         db.session.add(new_appt)
         db.session.commit()
         
         return jsonify({'message': 'Appointment booked', 'id': new_appt.id}), 201
         
-    # GET list
-    appts = Appointment.query.filter_by(user_id=current_user.id).order_by(Appointment.appointment_datetime).all()
-    return jsonify([{
-        'id': a.id,
-        'title': a.title,
-        'datetime': a.appointment_datetime.isoformat(),
-        'status': a.status
-    } for a in appts])
+    # GET list: keyset pagination on (appointment_datetime, id)
+    try:
+        # Zero or negative limits would mean no LIMIT at all to SQLite
+        limit = max(1, min(int(request.args.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE))
+        after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = Appointment.query.filter_by(user_id=current_user.id)
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    if after:
+        query = query.filter(tuple_(Appointment.appointment_datetime, Appointment.id) > after)
+    # Fetch one extra row to know whether another page exists
+    appts = query.order_by(Appointment.appointment_datetime, Appointment.id).limit(limit + 1).all()
+    has_more = len(appts) > limit
+    appts = appts[:limit]
+
+    return jsonify({
+        'appointments': [{
+            'id': a.id,
+            'title': a.title,
+            'datetime': a.appointment_datetime.isoformat(),
+            'end_datetime': a.end_datetime.isoformat() if a.end_datetime else None,
+            'status': a.status
+        } for a in appts],
+        'next_cursor': encode_cursor(appts[-1]) if has_more else None
+    })
+
+def expand_bulk_request(data):
+    """
+    Bulk payloads are either {"appointments": [...]} or a single appointment
+    with "repeat": {"every_days": 7, "count": 26}.
+    """
+    if 'appointments' in data:
+        items = data['appointments']
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValueError('appointments must be a list of objects')
+        return items
+    repeat = data.get('repeat') or {}
+    if not isinstance(repeat, dict):
+        raise ValueError('repeat must be an object')
+    every = timedelta(days=int(repeat.get('every_days', 7)))
+    count = int(repeat.get('count', 1))
+    if count > MAX_BULK:
+        raise ValueError(f'At most {MAX_BULK} appointments per request')
+    start, end = parse_appointment(data)
+    items = []
+    for i in range(count):
+        item = dict(data, datetime=(start + every * i).strftime('%Y-%m-%dT%H:%M'),
+                    end_datetime=(end + every * i).strftime('%Y-%m-%dT%H:%M'))
+        item.pop('repeat', None)
+        items.append(item)
+    return items
+
+@appointments.route('/api/appointments/bulk', methods=['POST'])
+@login_required
+def bulk_appointments():
+    """
+    Validate a whole batch (e.g. weekly sessions for six months) against the
+    user's existing appointments and against each other, then book all of
+    them in one transaction. Nothing is booked if any item fails.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        if not isinstance(data, dict):
+            raise ValueError('Expected a JSON object')
+        items = expand_bulk_request(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    if not items:
+        return jsonify({'error': 'No appointments'}), 400
+    if len(items) > MAX_BULK:
+        return jsonify({'error': f'At most {MAX_BULK} appointments per request'}), 400
+
+    errors = []
+    parsed = []
+    for index, item in enumerate(items):
+        try:
+            start, end = parse_appointment(item)
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        parsed.append((start, end, index, item))
+    if errors:
+        return jsonify({'error': 'Invalid appointments', 'items': errors}), 400
+
+    # One query for every existing appointment that could touch the batch,
+    # then a single sweep over batch + existing intervals sorted by start
+    parsed.sort()
+    existing = existing_intervals(current_user.id, parsed[0][0], max(end for _, end, _, _ in parsed))
+    intervals = [(s, e, 'existing', appt_id) for s, e, appt_id in existing] + \
+                [(s, e, 'new', index) for s, e, index, _ in parsed]
+    intervals.sort(key=lambda i: (i[0], i[1]))
+
+    conflicts = []
+    latest = None # interval with the furthest end seen so far
+    for interval in intervals:
+        if latest and interval[0] < latest[1]:
+            new, other = (interval, latest) if interval[2] == 'new' else (latest, interval)
+            if new[2] == 'new':
+                conflicts.append({'index': new[3], 'conflicts_with': {other[2]: other[3]}})
+        if latest is None or interval[1] > latest[1]:
+            latest = interval
+    if conflicts:
+        return jsonify({'error': 'Conflict: overlapping appointments', 'code': 409, 'items': conflicts}), 409
+
+    # One multi-row INSERT ... RETURNING; ORM objects would flush (and reload) row by row
+    now = datetime.utcnow()
+    ids = db.session.scalars(insert(Appointment).returning(Appointment.id), [{
+        'user_id': current_user.id,
+        'title': item['title'],
+        'description': item.get('description', ''),
+        'appointment_datetime': start,
+        'end_datetime': end,
+        'status': 'scheduled',
+        'created_at': now
+    } for start, end, _, item in parsed]).all()
+    db.session.commit()
+
+    # Rows were inserted in start order, so ascending ids follow it
+    return jsonify({'message': f'{len(ids)} appointments booked', 'ids': sorted(ids)}), 201
 
 @appointments.route('/api/appointments/<int:id>', methods=['DELETE'])
 @login_required
@@ -1,7 +1,9 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models import User, db
-from app import bcrypt
+from app import password_hasher
+from app.hashing import HasherBusy
+from app.identity import identity_cache
 from functools import wraps
 
 auth = Blueprint('auth', __name__)
@@ -16,7 +18,13 @@ def login():
         password = request.form.get('password')
         user = User.query.filter_by(email=email).first()
         
-        if user and bcrypt.check_password_hash(user.password_hash, password):
+        try:
+            valid = bool(user) and password_hasher.check_password_hash(user.password_hash, password)
+        except HasherBusy:
+            flash('We are handling a lot of sign-ins right now. Please try again in a moment.', 'warning')
+            return render_template('login.html'), 503
+
+        if valid:
             login_user(user)
             next_page = request.args.get('next')
             return redirect(next_page) if next_page else redirect(url_for('main.dashboard'))
@@ -40,7 +48,11 @@ def register():
             flash('Email already exists.', 'danger')
             return redirect(url_for('auth.register'))
             
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        try:
+            hashed_password = password_hasher.generate_password_hash(password).decode('utf-8')
+        except HasherBusy:
+            flash('We are handling a lot of sign-ups right now. Please try again in a moment.', 'warning')
+            return render_template('register.html'), 503
         user = User(email=email, password_hash=hashed_password, name=name)
         db.session.add(user)
         db.session.commit()
@@ -52,5 +64,7 @@ def register():
 
 @auth.route('/logout')
 def logout():
+    if current_user.is_authenticated:
+        identity_cache.invalidate(current_user.id)
     logout_user()
     return redirect(url_for('auth.login'))
\ No newline at end of file
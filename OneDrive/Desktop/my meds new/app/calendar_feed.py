@@ -0,0 +1,250 @@
+"""
+Per-user iCalendar feed of appointments and dose times, for calendar apps to
+subscribe to. The feed URL carries a secret token instead of a login.
+
+Rendered feeds are cached per token. An entry is marked stale after a commit
+that changed that user's appointments or medicines (see _track_changes), so
+polls are answered from memory, usually with a 304, without touching the
+database. CALENDAR_CACHE_TTL bounds staleness for changes committed by
+other processes.
+"""
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from itertools import chain
+from flask import Blueprint, Response, abort, current_app, jsonify, request, url_for
+from flask_login import login_required, current_user
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Session
+from app.models import db, Appointment, Medicine, User
+
+calendar_feed = Blueprint('calendar_feed', __name__)
+
+PRODID = '-//MyMeds//Calendar feed//EN'
+DOSE_DURATION = 'PT15M'
+DEFAULT_APPOINTMENT_DURATION = timedelta(minutes=30)
+# Columns that show up in the feed; other changes (e.g. adherence counters) keep the cache
+FEED_COLUMNS = {
+    Appointment: ('title', 'description', 'appointment_datetime', 'end_datetime', 'status', 'user_id'),
+    Medicine: ('name', 'dose', 'times', 'slot_minutes', 'start_date', 'end_date', 'user_id'),
+}
+
+FeedEntry = namedtuple('FeedEntry', 'user_id body etag last_modified expires')
+
+class FeedCache:
+    """
+    Size-bounded cache of rendered feeds keyed by token. Invalidated entries
+    are kept, stale, so an unchanged re-render keeps its Last-Modified.
+    """
+    def __init__(self, ttl=300, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._tokens = {}  # user_id -> token
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        """Fresh entry for token, or None."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry and entry.expires > time.monotonic():
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def put(self, token, user_id, body):
+        with self._lock:
+            etag = hashlib.sha1(body).hexdigest()
+            previous = self._entries.get(token)
+            if previous and previous.etag == etag:
+                last_modified = previous.last_modified
+            else:
+                last_modified = datetime.utcnow().replace(microsecond=0)
+            entry = self._entries[token] = FeedEntry(user_id, body, etag, last_modified, time.monotonic() + self.ttl)
+            self._entries.move_to_end(token)
+            self._tokens[user_id] = token
+            while len(self._entries) > self.max_size:
+                dropped_token, dropped = self._entries.popitem(last=False)
+                if self._tokens.get(dropped.user_id) == dropped_token:
+                    del self._tokens[dropped.user_id]
+            return entry
+
+    def invalidate(self, user_id):
+        with self._lock:
+            token = self._tokens.get(user_id)
+            if token in self._entries:
+                self._entries[token] = self._entries[token]._replace(expires=0)
+
+    def drop(self, user_id):
+        """Forget the user's feed entirely, e.g. after its token was rotated."""
+        with self._lock:
+            self._entries.pop(self._tokens.pop(user_id, None), None)
+
+feed_cache = FeedCache()
+
+def _escape(text):
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,') \
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+
+def _fold(line):
+    """Split content lines at 75 octets (RFC 5545 3.1), never inside a UTF-8 sequence."""
+    data = line.encode('utf-8')
+    parts, limit = [], 75
+    while len(data) > limit:
+        cut = limit
+        while data[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+        limit = 74  # continuation lines start with a space
+    parts.append(data)
+    return b'\r\n '.join(parts).decode('utf-8')
+
+def _utc(dt):
+    return dt.strftime('%Y%m%dT%H%M%SZ')
+
+def appointment_event(appt):
+    end = appt.end_datetime or appt.appointment_datetime + DEFAULT_APPOINTMENT_DURATION
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:appointment-{appt.id}@mymeds',
+        f'DTSTAMP:{_utc(appt.created_at or appt.appointment_datetime)}',
+        f'DTSTART:{_utc(appt.appointment_datetime)}',
+        f'DTEND:{_utc(end)}',
+        f'SUMMARY:{_escape(appt.title)}',
+        'STATUS:' + ('CANCELLED' if appt.status == 'cancelled' else 'CONFIRMED'),
+    ]
+    if appt.description:
+        lines.append(f'DESCRIPTION:{_escape(appt.description)}')
+    lines.append('END:VEVENT')
+    return lines
+
+def dose_events(med):
+    """
+    One daily recurring event per dose time. Separate events because BYHOUR
+    and BYMINUTE combine as a cross product, not as pairs.
+    """
+    first_day = (med.start_date or med.created_at).replace(hour=0, minute=0, second=0, microsecond=0)
+    rule = 'RRULE:FREQ=DAILY'
+    if med.end_date:
+        # Reminders stop after end_date (reminders.purge_reminders); UNTIL is inclusive
+        rule += f';UNTIL={_utc(med.end_date)}'
+    lines = []
+    for minute in med.get_slot_minutes():
+        start = first_day + timedelta(minutes=minute)
+        if med.end_date and start > med.end_date:
+            continue
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:medicine-{med.id}-{minute}@mymeds',
+            f'DTSTAMP:{_utc(med.created_at or first_day)}',
+            f'DTSTART:{_utc(start)}',
+            f'DURATION:{DOSE_DURATION}',
+            rule,
+            f'SUMMARY:{_escape(f"Take {med.name} ({med.dose})")}',
+            'END:VEVENT',
+        ]
+    return lines
+
+def render_feed(user_id, now=None):
+    """The user's feed as bytes: appointments since CALENDAR_PAST_DAYS ago and every current medicine."""
+    now = now or datetime.utcnow()
+    since = now - timedelta(days=current_app.config['CALENDAR_PAST_DAYS'])
+    appts = Appointment.query.filter(
+        Appointment.user_id == user_id,
+        Appointment.appointment_datetime >= since
+    ).order_by(Appointment.appointment_datetime, Appointment.id).all()
+    meds = Medicine.query.filter(
+        Medicine.user_id == user_id,
+        or_(Medicine.end_date == None, Medicine.end_date >= since)
+    ).order_by(Medicine.id).all()
+
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN',
+             'METHOD:PUBLISH', 'X-WR-CALNAME:MyMeds']
+    for appt in appts:
+        lines += appointment_event(appt)
+    for med in meds:
+        lines += dose_events(med)
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(_fold(line) for line in lines) + '\r\n').encode('utf-8')
+
+@calendar_feed.route('/calendar/<token>.ics')
+def feed(token):
+    entry = feed_cache.get(token)
+    if entry is None:
+        user_id = db.session.query(User.id).filter_by(calendar_token=token).scalar()
+        if user_id is None:
+            abort(404)
+        entry = feed_cache.put(token, user_id, render_feed(user_id))
+
+    response = Response(entry.body, mimetype='text/calendar')
+    response.set_etag(entry.etag)
+    response.last_modified = entry.last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+def _feed_url(token):
+    return url_for('calendar_feed.feed', token=token, _external=True)
+
+@calendar_feed.route('/api/calendar', methods=['GET'])
+@login_required
+def calendar_settings():
+    """Subscription URL of the current user's feed, created on first use."""
+    user = db.session.get(User, current_user.id)
+    if not user.calendar_token:
+        user.calendar_token = secrets.token_urlsafe(32)
+        db.session.commit()
+    return jsonify({'url': _feed_url(user.calendar_token)})
+
+@calendar_feed.route('/api/calendar/token', methods=['POST', 'DELETE'])
+@login_required
+def rotate_token():
+    """POST issues a new feed URL, DELETE disables the feed; either way the old URL stops working."""
+    user = db.session.get(User, current_user.id)
+    user.calendar_token = secrets.token_urlsafe(32) if request.method == 'POST' else None
+    db.session.commit()
+    feed_cache.drop(user.id)
+    if user.calendar_token is None:
+        return jsonify({'message': 'Calendar feed disabled'})
+    return jsonify({'url': _feed_url(user.calendar_token)})
+
+def _feed_changed(obj):
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in FEED_COLUMNS[type(obj)])
+
+@event.listens_for(Session, 'after_flush')
+def _track_changes(session, flush_context):
+    # History is still available here; the cache is only touched after commit
+    changed = {obj.user_id for obj in chain(session.new, session.deleted)
+               if isinstance(obj, (Appointment, Medicine))}
+    changed.update(obj.user_id for obj in session.dirty
+                   if isinstance(obj, (Appointment, Medicine)) and _feed_changed(obj))
+    if changed:
+        session.info.setdefault('calendar_users', set()).update(changed)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_inserts(orm_execute_state):
+    # insert(Appointment) with a list of rows (e.g. bulk booking) bypasses the flush
+    mapper = orm_execute_state.bind_mapper
+    if not orm_execute_state.is_insert or mapper is None or mapper.class_ not in FEED_COLUMNS:
+        return
+    params = orm_execute_state.parameters or []
+    rows = params if isinstance(params, list) else [params]
+    changed = {row['user_id'] for row in rows if 'user_id' in row}
+    if changed:
+        orm_execute_state.session.info.setdefault('calendar_users', set()).update(changed)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_feeds(session):
+    for user_id in session.info.pop('calendar_users', ()):
+        feed_cache.invalidate(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changes(session):
+    session.info.pop('calendar_users', None)
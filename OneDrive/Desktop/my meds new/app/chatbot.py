@@ -1,47 +1,47 @@
-from flask import Blueprint, request, jsonify, render_template
-import re
+from flask import Blueprint, Response, current_app, request, jsonify, render_template, stream_with_context
+from app.matcher import DEFAULT_LEXICON, KeywordMatcher
+from functools import lru_cache
+import json
 
 chatbot = Blueprint('chatbot', __name__)
 
-CRISIS_KEYWORDS = ['suicide', 'kill', 'die', 'harm', 'dead']
-NEG_KEYWORDS = ['sad', 'depressed', 'anxious', 'worried', 'bad', 'panic', 'stress']
-POS_KEYWORDS = ['happy', 'good', 'great', 'fine', 'better', 'thanks']
+BATCH_LIMIT = 1000
+
+@lru_cache(maxsize=None)
+def _load_matcher(path):
+    return KeywordMatcher.from_file(path)
+
+def get_matcher():
+    """
+    The keyword automaton for CHAT_LEXICON_PATH, compiled on first use rather
+    than at import. Keyword lexicons live in a data file so they can grow
+    without code changes.
+    """
+    return _load_matcher(current_app.config['CHAT_LEXICON_PATH'] or DEFAULT_LEXICON)
+
+INTENT_REPLIES = {
+    'info_appt': "You can view and book appointments in the Appointments section.",
+    'info_meds': "Don't forget to log your medicines in the Dashboard.",
+}
 
 def get_sentiment_score(text):
-    text = text.lower()
-    score = 0.0
-    
-    # Simple counting scorer
-    words = re.findall(r'\w+', text)
-    count = len(words)
-    if count == 0: return 0.0
-    
-    for w in words:
-        if w in NEG_KEYWORDS: score -= 0.5
-        if w in POS_KEYWORDS: score += 0.5
-        
-    # Clamp -1 to 1
-    return max(min(score, 1.0), -1.0)
+    return get_matcher().match(text)[2]
 
 def generate_response(text):
-    text_lower = text.lower()
+    # Crisis, intent and sentiment come from a single pass over the message
+    crisis, intent, score = get_matcher().match(text)
     
     # High risk check
-    if any(k in text_lower for k in CRISIS_KEYWORDS):
+    if crisis:
         return {
             'reply': "I am concerned about what you're saying. If you are in immediate danger, please call 911 or your local emergency services immediately. This is not medical advice.",
             'intent': 'crisis',
             'score': -1.0
         }
         
-    score = get_sentiment_score(text)
-    
     # Simple Intent matching
-    if 'appointment' in text_lower:
-        return {'reply': "You can view and book appointments in the Appointments section.", 'intent': 'info_appt', 'score': score}
-    
-    if 'medicine' in text_lower or 'pill' in text_lower:
-        return {'reply': "Don't forget to log your medicines in the Dashboard.", 'intent': 'info_meds', 'score': score}
+    if intent in INTENT_REPLIES:
+        return {'reply': INTENT_REPLIES[intent], 'intent': intent, 'score': score}
         
     if score <= -0.3:
         return {'reply': "I'm sorry to hear you're feeling down. Have you tried taking a short walk or practicing deep breathing? (Not medical advice)", 'intent': 'mood_neg', 'score': score}
@@ -55,10 +55,69 @@ def generate_response(text):
 def chat_ui():
     return render_template('chatbot.html')
 
+def normalize_message(text):
+    return ' '.join(text.lower().split())
+
+@chatbot.record_once
+def _init_response_cache(state):
+    state.app.extensions['chat_cache'] = lru_cache(maxsize=state.app.config['CHAT_CACHE_SIZE'])(generate_response)
+
+def cached_response(text):
+    """
+    generate_response through a bounded LRU cache (CHAT_CACHE_SIZE) keyed on
+    the normalized text; most traffic is the same short phrases.
+    """
+    if not isinstance(text, str):
+        text = ''
+    return dict(current_app.extensions['chat_cache'](normalize_message(text)))
+
 @chatbot.route('/api/chat', methods=['POST'])
 def chat_api():
     data = request.get_json()
     message = data.get('message', '')
     
-    response = generate_response(message)
-    return jsonify(response)
\ No newline at end of file
+    response = cached_response(message)
+    return jsonify(response)
+
+@chatbot.route('/api/chat/batch', methods=['POST'])
+def chat_batch_api():
+    """{"messages": [...]} -> {"results": [...]}, in the same order."""
+    data = request.get_json() or {}
+    messages = data.get('messages')
+    if not isinstance(messages, list):
+        return jsonify({'error': 'messages must be a list'}), 400
+    if len(messages) > BATCH_LIMIT:
+        return jsonify({'error': f'At most {BATCH_LIMIT} messages per batch; use /api/chat/stream'}), 400
+
+    return jsonify({'results': [cached_response(m) for m in messages]})
+
+def _parse_stream_line(line):
+    item = json.loads(line)
+    return item.get('message', '') if isinstance(item, dict) else item
+
+@chatbot.route('/api/chat/stream', methods=['POST'])
+def chat_stream_api():
+    """
+    NDJSON in, NDJSON out: one {"message": ...} object (or JSON string) per
+    input line, one result per output line in the same order. Input is read
+    and answered line by line, so arbitrarily large transcripts use flat memory.
+    """
+    stream = request.stream
+
+    def generate():
+        for raw in stream:
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                result = cached_response(_parse_stream_line(line))
+            except ValueError:
+                result = {'error': 'Invalid JSON line'}
+            yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@chatbot.route('/api/chat/cache')
+def chat_cache_stats():
+    info = current_app.extensions['chat_cache'].cache_info()
+    return jsonify({'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'maxsize': info.maxsize})
\ No newline at end of file
@@ -0,0 +1,105 @@
+import click
+
+@click.command('init-db')
+@click.option('--force', is_flag=True, help='Check every table even if the schema looks current.')
+def init_db_command(force):
+    """Create or upgrade the database schema for the current models."""
+    from app.schema import upgrade_schema
+    if upgrade_schema(force=force):
+        click.echo("Schema upgraded")
+    else:
+        click.echo("Schema already current")
+
+@click.command('run-worker')
+@click.option('--worker-id', help='Lease owner name; defaults to host:pid.')
+def run_worker_command(worker_id):
+    """Run the reminder jobs in this process (same as worker.py)."""
+    from flask import current_app
+    from app.reminders import run_worker
+    run_worker(current_app._get_current_object(), worker_id)
+
+@click.command('rebuild-adherence')
+def rebuild_adherence_command():
+    """Recompute every medicine's adherence counters from DoseLog."""
+    from app.utils import rebuild_all_adherence_summaries
+    rebuilt = rebuild_all_adherence_summaries()
+    click.echo(f"Rebuilt adherence for {rebuilt} medicines")
+
+@click.command('apply-retention')
+def apply_retention_command():
+    """Roll up old dose logs into monthly totals and prune finished reminders."""
+    from flask import current_app
+    from app.retention import apply_retention
+    archived, pruned = apply_retention(current_app.config)
+    click.echo(f"Archived {archived} dose logs, pruned {pruned} reminders")
+
+@click.command('adherence-report')
+@click.option('--days', default=30, show_default=True, help='Length of the report window, ending today.')
+@click.option('--user', 'emails', multiple=True, help='Restrict to these users (repeatable); default is everyone.')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--output', type=click.File('w'), default='-', help='File to write; default stdout.')
+def adherence_report_command(days, emails, fmt, output):
+    """Per-user adherence, totals and streaks over the last DAYS days."""
+    from datetime import datetime, timedelta
+    from app import analytics, transfer
+    user_ids = [_user_id(email) for email in emails] or None
+    end = datetime.utcnow()
+    records = analytics.cohort_report(end - timedelta(days=days - 1), end, user_ids)
+    for chunk in transfer.render_records(records, fmt, analytics.COHORT_FIELDS):
+        output.write(chunk)
+
+def _user_id(email):
+    from app.models import User
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        raise click.ClickException(f"No user with email {email}")
+    return user.id
+
+def _format_for(path, fmt):
+    return fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+
+@click.command('import-history')
+@click.argument('kind', type=click.Choice(['medicines', 'doses']))
+@click.argument('email')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Defaults from the file extension.')
+def import_history_command(kind, email, path, fmt):
+    """Stream medicines or dose logs from a CSV/NDJSON file into a user's account."""
+    from app import transfer
+    user_id = _user_id(email)
+    with open(path, 'rb') as f:
+        rows = transfer.iter_rows(f, _format_for(path, fmt))
+        if kind == 'medicines':
+            report = transfer.import_medicines(user_id, rows)
+        else:
+            report = transfer.import_dose_logs(user_id, rows)
+    click.echo(f"Imported {report.imported} {kind}, {report.failed} failed")
+    for error in report.errors:
+        click.echo(f"  row {error['row']}: {error['error']}", err=True)
+
+@click.command('export-history')
+@click.argument('kind', type=click.Choice(['medicines', 'doses']))
+@click.argument('email')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Defaults from the file extension.')
+def export_history_command(kind, email, path, fmt):
+    """Stream a user's medicines or dose history to a CSV/NDJSON file."""
+    from app import transfer
+    user_id = _user_id(email)
+    if kind == 'medicines':
+        records, fields = transfer.iter_medicine_records(user_id), transfer.MEDICINE_FIELDS
+    else:
+        records, fields = transfer.iter_dose_records(user_id), transfer.DOSE_FIELDS
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in transfer.render_records(records, _format_for(path, fmt), fields):
+            f.write(chunk)
+    click.echo(f"Exported {kind} to {path}")
+
+def register_commands(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(run_worker_command)
+    app.cli.add_command(rebuild_adherence_command)
+    app.cli.add_command(apply_retention_command)
+    app.cli.add_command(adherence_report_command)
+    app.cli.add_command(import_history_command)
+    app.cli.add_command(export_history_command)
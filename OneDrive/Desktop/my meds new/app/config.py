@@ -7,14 +7,97 @@ class Config:
     SECRET_KEY = os.environ.get('FLASK_SECRET_KEY') or 'dev-key-please-change'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///meditrack.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Applied to every SQLite connection (see app/database.py)
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL', # readers don't block the writer
+        'synchronous': 'NORMAL', # durable with WAL, far fewer fsyncs than FULL
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)), # wait for the write lock instead of failing
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)), # negative = KiB
+        'temp_store': 'MEMORY',
+    }
+    # Request threads + scheduler threads share the pool
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': 30,
+    }
+    # Merged into the engine's connect_args for SQLite file databases. The lock wait is
+    # set only by SQLITE_PRAGMAS['busy_timeout'], which would override a driver 'timeout'.
+    SQLITE_CONNECT_ARGS = {'check_same_thread': False}
+
+    # Password hashing runs on its own bounded pool (see app/hashing.py)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 32)) # waiting hashes before rejecting with 503
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30)) # seconds a loaded user is reused
     
     # Mail settings
     SMTP_HOST = os.environ.get('SMTP_HOST')
     SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
     SMTP_USER = os.environ.get('SMTP_USER')
     SMTP_PASS = os.environ.get('SMTP_PASS')
+    SMTP_TIMEOUT = int(os.environ.get('SMTP_TIMEOUT', 30))
+    SMTP_BACKEND = os.environ.get('SMTP_BACKEND', 'smtp') # 'smtp', or 'sink' to record mail locally
+    SMTP_SINK_LATENCY = float(os.environ.get('SMTP_SINK_LATENCY', 0)) # seconds per message in the sink
+    SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 4)) # connections = sender threads
+    SMTP_RATE_LIMIT = float(os.environ.get('SMTP_RATE_LIMIT', 0)) # messages per second, 0 = unlimited
+
+    # Chatbot (app/chatbot.py)
+    CHAT_CACHE_SIZE = int(os.environ.get('CHAT_CACHE_SIZE', 4096)) # cached replies, keyed on the normalized message
+    CHAT_LEXICON_PATH = os.environ.get('CHAT_LEXICON_PATH') # default: app/data/chat_lexicon.json
+
+    # Reminders
+    # Medicines are queued when created/changed; this job only rolls the 24h window forward
+    REMINDER_HORIZON_INTERVAL_MINUTES = int(os.environ.get('REMINDER_HORIZON_INTERVAL_MINUTES', 60))
+    REMINDER_BATCH_SIZE = int(os.environ.get('REMINDER_BATCH_SIZE', 200)) # users leased (and written back) per batch
+    REMINDER_LEASE_SECONDS = int(os.environ.get('REMINDER_LEASE_SECONDS', 300)) # claims older than this are reclaimed
+    REMINDER_POLL_SECONDS = int(os.environ.get('REMINDER_POLL_SECONDS', 60)) # worker.py queue polling interval
+    # Run APScheduler inside the dev server; disable when running worker.py
+    REMINDER_SCHEDULER_IN_APP = os.environ.get('REMINDER_SCHEDULER_IN_APP', 'true').lower() == 'true'
+    # Send through the in-memory dispatcher (app/dispatcher.py), which sleeps until the next
+    # reminder is due, instead of polling the queue every REMINDER_POLL_SECONDS
+    REMINDER_DISPATCHER = os.environ.get('REMINDER_DISPATCHER', 'true').lower() == 'true'
+    REMINDER_DISPATCH_HORIZON_MINUTES = int(os.environ.get('REMINDER_DISPATCH_HORIZON_MINUTES', 10)) # reloaded from the DB after this
+    REMINDER_DISPATCH_CHECK_SECONDS = float(os.environ.get('REMINDER_DISPATCH_CHECK_SECONDS', 5)) # max(id) check for rows planned elsewhere
+    REMINDER_DISPATCH_MAX_LOADED = int(os.environ.get('REMINDER_DISPATCH_MAX_LOADED', 10000)) # heap size cap; shortens the horizon
+    # Digest mode: one email per user for reminders due within the window (per-user override: User.reminder_digest)
+    REMINDER_DIGEST = os.environ.get('REMINDER_DIGEST', 'false').lower() == 'true'
+    REMINDER_DIGEST_WINDOW_MINUTES = int(os.environ.get('REMINDER_DIGEST_WINDOW_MINUTES', 15))
+
+    # Retention: DoseLog rows older than this are rolled up per month (DoseRollup);
+    # sent or exhausted reminders older than this are deleted
+    DOSE_LOG_RETENTION_DAYS = int(os.environ.get('DOSE_LOG_RETENTION_DAYS', 365))
+    REMINDER_RETENTION_DAYS = int(os.environ.get('REMINDER_RETENTION_DAYS', 30))
+    RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', 500)) # rows per write transaction
+    RETENTION_INTERVAL_HOURS = int(os.environ.get('RETENTION_INTERVAL_HOURS', 24))
+
+    # Startup: upgrade the schema from create_app when the models changed (a single
+    # read otherwise). Set to false in production and run `flask init-db` on deploy.
+    SCHEMA_AUTO_UPGRADE = os.environ.get('SCHEMA_AUTO_UPGRADE', 'true').lower() == 'true'
+
+    # Calendar feed (app/calendar_feed.py)
+    CALENDAR_CACHE_TTL = int(os.environ.get('CALENDAR_CACHE_TTL', 300)) # bounds staleness after changes made by other processes
+    CALENDAR_CACHE_SIZE = int(os.environ.get('CALENDAR_CACHE_SIZE', 1024)) # rendered feeds kept in memory
+    CALENDAR_PAST_DAYS = int(os.environ.get('CALENDAR_PAST_DAYS', 90)) # older appointments are left out of the feed
+
+    # Instrumentation (app/instrumentation.py)
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', 'true').lower() == 'true'
+    QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', 20)) # SQL statements per request before it is flagged
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0)) # fraction of requests run under cProfile
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') # default: instance/profiles
+    # Clients allowed to read /metrics; behind a local reverse proxy every client looks local, so block /metrics there
+    METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+class WorkerConfig(Config):
+    # worker.py drives the jobs itself
+    REMINDER_SCHEDULER_IN_APP = False
 
 class TestConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
-    WTF_CSRF_ENABLED = False
\ No newline at end of file
+    # In-memory SQLite uses a single static connection
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    WTF_CSRF_ENABLED = False
+    SMTP_BACKEND = 'sink'
\ No newline at end of file
@@ -0,0 +1,31 @@
+from sqlalchemy import event
+from app.models import db
+
+def _apply_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+    return on_connect
+
+def init_database(app):
+    """
+    Bind the SQLAlchemy extension and, for SQLite, run SQLITE_PRAGMAS on every
+    new connection. WAL + busy_timeout lets the reminder jobs and request
+    threads write to the same file without "database is locked" errors.
+    Pool sizing comes from SQLALCHEMY_ENGINE_OPTIONS.
+    """
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if uri.startswith('sqlite') and ':memory:' not in uri:
+        options = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+        options['connect_args'] = dict(app.config['SQLITE_CONNECT_ARGS'], **options.get('connect_args', {}))
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    db.init_app(app)
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name == 'sqlite' and app.config['SQLITE_PRAGMAS']:
+            event.listen(engine, 'connect', _apply_pragmas(app.config['SQLITE_PRAGMAS']))
@@ -0,0 +1,235 @@
+"""
+In-memory reminder dispatcher: keeps the next REMINDER_DISPATCH_HORIZON_MINUTES
+of unsent reminders in a heap and sleeps until the earliest one is due, instead
+of polling ReminderQueue every minute.
+
+ReminderQueue stays the source of truth. Firing goes through the normal lease
+and send path (process_reminder_queue), so several workers, crashes and
+retries behave exactly as with polling. The heap is rebuilt from the database
+when the horizon runs out, and topped up when new rows are planned: directly
+from this process (notify_planned), or by a cheap max(id) check for rows
+planned by the web processes.
+"""
+import heapq
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app.models import db, ReminderQueue
+from app.reminders import MAX_ATTEMPTS, default_worker_id, process_reminder_queue
+
+logger = logging.getLogger(__name__)
+
+# Lateness samples kept for the percentiles in stats()
+LATENCY_SAMPLES = 1000
+# Longest pause after dispatches that sent nothing (e.g. SMTP down)
+MAX_BACKOFF_SECONDS = 60
+
+_running = weakref.WeakSet()
+
+def notify_planned():
+    """Wake the dispatchers of this process after new ReminderQueue rows were committed."""
+    for dispatcher in list(_running):
+        dispatcher.wake()
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+class ReminderDispatcher:
+    def __init__(self, app, worker_id=None, send=None):
+        self.app = app
+        self.horizon = timedelta(minutes=app.config['REMINDER_DISPATCH_HORIZON_MINUTES'])
+        self.check_seconds = app.config['REMINDER_DISPATCH_CHECK_SECONDS']
+        self.max_loaded = app.config['REMINDER_DISPATCH_MAX_LOADED']
+        worker_id = worker_id or default_worker_id()
+        self._send = send or (lambda: process_reminder_queue(app, worker_id))
+
+        self._lock = threading.Lock()
+        self._heap = []  # (send_at, reminder id)
+        self._loaded = set()
+        self._last_id = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.horizon_end = None
+        self.fired = 0
+        self.dispatches = 0
+        self.refreshes = 0
+        self._backoff = 0
+        self._retry_at = None  # time.monotonic() before which nothing is dispatched
+        self._lateness = deque(maxlen=LATENCY_SAMPLES)
+
+    def refresh(self, full=True):
+        """
+        Load unsent reminders due before the horizon. A full refresh rebuilds
+        the heap (picking up retries and expired leases); otherwise only rows
+        with ids beyond the last load are added.
+        """
+        with self.app.app_context():
+            now = datetime.utcnow()
+            horizon_end = now + self.horizon
+            last_id = db.session.query(func.max(ReminderQueue.id)).scalar() or 0
+            query = db.session.query(ReminderQueue.id, ReminderQueue.send_at).filter(
+                ReminderQueue.sent == False,
+                ReminderQueue.attempts < MAX_ATTEMPTS,
+                ReminderQueue.send_at <= horizon_end,
+                ReminderQueue.id <= last_id
+            )
+            if not full:
+                query = query.filter(ReminderQueue.id > self._last_id)
+            rows = query.order_by(ReminderQueue.send_at).limit(self.max_loaded).all()
+            db.session.close()
+
+        with self._lock:
+            if full:
+                self._heap, self._loaded = [], set()
+                self.horizon_end = horizon_end
+            if len(rows) == self.max_loaded:
+                # Too many rows to hold: shrink the horizon to what was loaded, but never
+                # into the past (an overdue backlog would otherwise reload on every loop)
+                self.horizon_end = max(min(self.horizon_end, rows[-1].send_at),
+                                       now + timedelta(seconds=self.check_seconds))
+            for row in rows:
+                if row.id not in self._loaded and row.send_at <= self.horizon_end:
+                    heapq.heappush(self._heap, (row.send_at, row.id))
+                    self._loaded.add(row.id)
+            self._last_id = last_id
+            self.refreshes += 1
+        if full:
+            logger.info(f"Dispatcher loaded {len(rows)} reminders until {self.horizon_end:%H:%M:%S}; stats {self.stats()}")
+        return len(rows)
+
+    def _has_new_rows(self):
+        with self.app.app_context():
+            last_id = db.session.query(func.max(ReminderQueue.id)).scalar() or 0
+            db.session.close()
+        return last_id > self._last_id
+
+    def _pop_due(self, now):
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                send_at, reminder_id = heapq.heappop(self._heap)
+                self._loaded.discard(reminder_id)
+                due.append(send_at)
+        return due
+
+    def _seconds_until_next(self, now):
+        with self._lock:
+            deadline = min(self._heap[0][0], self.horizon_end) if self._heap else self.horizon_end
+        return (deadline - now).total_seconds()
+
+    def run_once(self):
+        """
+        Fire whatever is due, then return how long to sleep (seconds) until the
+        next deadline. Used by the thread loop; handy for driving it directly.
+        """
+        if self._retry_at is not None:
+            remaining = self._retry_at - time.monotonic()
+            if remaining > 0:
+                return remaining
+            self._retry_at = None
+
+        now = datetime.utcnow()
+        if self.horizon_end is None or now >= self.horizon_end:
+            self.refresh(full=True)
+            now = datetime.utcnow()
+
+        due = self._pop_due(now)
+        if due:
+            with self._lock:
+                self._lateness.extend((now - send_at).total_seconds() for send_at in due)
+                self.fired += len(due)
+                self.dispatches += 1
+            # One lease-and-send pass covers everything due, including rows not in this heap
+            if self._send():
+                self._backoff = 0
+                return 0
+            # Nothing went out: failed rows keep their remaining attempts for later
+            # instead of burning them in a tight loop
+            self._backoff = min(max(self._backoff * 2, self.check_seconds), MAX_BACKOFF_SECONDS)
+            self._retry_at = time.monotonic() + self._backoff
+            logger.warning(f"Dispatch sent nothing; retrying in {self._backoff:.0f}s")
+            return self._backoff
+        return max(self._seconds_until_next(datetime.utcnow()), 0)
+
+    def _run(self):
+        next_check = time.monotonic() + self.check_seconds
+        while not self._stop.is_set():
+            try:
+                sleep = self.run_once()
+                if sleep == 0:
+                    continue
+                if self._wake.wait(min(sleep, max(next_check - time.monotonic(), 0))):
+                    self._wake.clear()
+                    if not self._stop.is_set():
+                        self.refresh(full=False)
+                elif time.monotonic() >= next_check and self._has_new_rows():
+                    # Rows planned by another process (e.g. a web request)
+                    self.refresh(full=False)
+                if time.monotonic() >= next_check:
+                    next_check = time.monotonic() + self.check_seconds
+            except Exception:
+                logger.exception("Reminder dispatcher iteration failed")
+                self._stop.wait(self.check_seconds)
+
+    def wake(self):
+        self._wake.set()
+
+    def start(self):
+        _running.add(self)
+        self._thread = threading.Thread(target=self._run, name='reminder-dispatcher', daemon=True)
+        self._thread.start()
+        logger.info("Reminder dispatcher started")
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        _running.discard(self)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        """Queue depth, horizon and dispatch lateness percentiles (seconds)."""
+        with self._lock:
+            ordered = sorted(self._lateness)
+            stats = {
+                'depth': len(self._heap),
+                'next_due': self._heap[0][0].isoformat() if self._heap else None,
+                'horizon_end': self.horizon_end.isoformat() if self.horizon_end else None,
+                'fired': self.fired,
+                'dispatches': self.dispatches,
+                'refreshes': self.refreshes,
+            }
+        stats['lateness_seconds'] = {
+            'p50': round(_percentile(ordered, 50), 3),
+            'p90': round(_percentile(ordered, 90), 3),
+            'p99': round(_percentile(ordered, 99), 3),
+            'max': round(ordered[-1], 3),
+        } if ordered else None
+        return stats
+
+    def metric_lines(self):
+        """Prometheus gauges and counters for app.instrumentation."""
+        stats = self.stats()
+        lines = [
+            '# HELP mymeds_reminder_dispatcher_depth Reminders waiting in the dispatcher heap.',
+            '# TYPE mymeds_reminder_dispatcher_depth gauge',
+            f"mymeds_reminder_dispatcher_depth {stats['depth']}",
+            '# HELP mymeds_reminder_dispatcher_fired_total Reminders whose deadline was dispatched.',
+            '# TYPE mymeds_reminder_dispatcher_fired_total counter',
+            f"mymeds_reminder_dispatcher_fired_total {stats['fired']}",
+            '# HELP mymeds_reminder_dispatcher_refreshes_total Loads of the heap from ReminderQueue.',
+            '# TYPE mymeds_reminder_dispatcher_refreshes_total counter',
+            f"mymeds_reminder_dispatcher_refreshes_total {stats['refreshes']}",
+        ]
+        if stats['lateness_seconds']:
+            lines += ['# HELP mymeds_reminder_dispatch_lateness_seconds Delay between send_at and dispatch.',
+                      '# TYPE mymeds_reminder_dispatch_lateness_seconds summary']
+            lines += [f'mymeds_reminder_dispatch_lateness_seconds{{quantile="{q}"}} {stats["lateness_seconds"][key]}'
+                      for q, key in (('0.5', 'p50'), ('0.9', 'p90'), ('0.99', 'p99'))]
+        return lines
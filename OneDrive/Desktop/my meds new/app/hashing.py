@@ -0,0 +1,103 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+class HasherBusy(Exception):
+    """Raised when the password hashing queue is full, or a hash waited longer than PASSWORD_HASH_TIMEOUT."""
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small dedicated thread pool so a login burst can use at
+    most PASSWORD_HASH_WORKERS cores. Requests beyond PASSWORD_HASH_QUEUE
+    waiting hashes are rejected with HasherBusy instead of piling up and
+    starving every other route.
+    """
+    def __init__(self, bcrypt, app=None):
+        self.bcrypt = bcrypt
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self.max_queue = 0
+        self.timeout = None
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds = 0.0
+        self.hash_seconds = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        workers = app.config['PASSWORD_HASH_WORKERS']
+        self.max_queue = app.config['PASSWORD_HASH_QUEUE']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_queue:
+                self.rejected += 1
+                raise HasherBusy()
+            self._pending += 1
+        submitted = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                # Counted here, not by the caller: a timed-out hash still occupies the queue
+                with self._lock:
+                    self._pending -= 1
+                    self.completed += 1
+                    self.wait_seconds += started - submitted
+                    self.hash_seconds += time.perf_counter() - started
+
+        future = self._executor.submit(task)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+                if future.cancel():
+                    # Never started, so task() will not release its slot
+                    self._pending -= 1
+            raise HasherBusy()
+
+    def check_password_hash(self, pw_hash, password):
+        return self._run(self.bcrypt.check_password_hash, pw_hash, password)
+
+    def generate_password_hash(self, password):
+        return self._run(self.bcrypt.generate_password_hash, password)
+
+    def stats(self):
+        with self._lock:
+            done = self.completed or 1
+            return {
+                'pending': self._pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'avg_wait_ms': round(self.wait_seconds / done * 1000, 2),
+                'avg_hash_ms': round(self.hash_seconds / done * 1000, 2),
+            }
+
+    def metric_lines(self):
+        """Prometheus gauges and counters for app.instrumentation."""
+        stats = self.stats()
+        lines = []
+        for key, kind, help_text in (
+                ('pending', 'gauge', 'Password hashes queued or running.'),
+                ('completed', 'counter', 'Password hashes finished.'),
+                ('rejected', 'counter', 'Password hashes rejected because the queue was full.'),
+                ('timed_out', 'counter', 'Password hashes the request stopped waiting for.')):
+            name = f'mymeds_password_hash_{key}' + ('_total' if kind == 'counter' else '')
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {stats[key]}']
+        lines += ['# HELP mymeds_password_hash_wait_seconds_avg Mean time a hash waited for a worker.',
+                  '# TYPE mymeds_password_hash_wait_seconds_avg gauge',
+                  f"mymeds_password_hash_wait_seconds_avg {stats['avg_wait_ms'] / 1000}",
+                  '# HELP mymeds_password_hash_seconds_avg Mean bcrypt run time.',
+                  '# TYPE mymeds_password_hash_seconds_avg gauge',
+                  f"mymeds_password_hash_seconds_avg {stats['avg_hash_ms'] / 1000}"]
+        return lines
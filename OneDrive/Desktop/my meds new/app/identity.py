@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from app.models import db, User
+
+class IdentityCache:
+    """
+    Short-TTL, size-bounded cache of User column values for the Flask-Login
+    user loader, so authenticated requests skip the User lookup. Entries are
+    dropped on logout and whenever a User row is updated or deleted; the TTL
+    bounds staleness across processes.
+    """
+    def __init__(self, ttl=30, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, user_id, values):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+identity_cache = IdentityCache()
+
+def load_cached_user(user_id):
+    """
+    User for the session, from the cache when possible. A cached user is
+    attached to the current session without a query, so it behaves like a
+    freshly loaded one.
+    """
+    values = identity_cache.get(user_id)
+    if values is not None:
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        identity_cache.put(user_id, {c.key: getattr(user, c.key) for c in inspect(User).column_attrs})
+    return user
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_on_change(mapper, connection, target):
+    identity_cache.invalidate(target.id)
@@ -0,0 +1,229 @@
+"""
+Request and job instrumentation: latency and SQL-count histograms per
+endpoint, per-job timings, a per-request query budget and sampled cProfile
+dumps. Metrics are served in Prometheus text format on /metrics, to local
+clients only.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from flask import Blueprint, Response, abort, current_app, g, request
+from sqlalchemy import event
+from app.models import db
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# SQL statements executed by the current request or job; None outside of one
+_query_count = ContextVar('query_count', default=None)
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label tuple."""
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, label_values, value):
+        counts, total = self.series.get(label_values, ([0] * len(self.buckets), [0, 0.0]))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        total[0] += 1
+        total[1] += value
+        self.series[label_values] = (counts, total)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, (count, total)) in sorted(self.series.items()):
+            labels = _labels(self.labels, label_values)
+            for bound, n in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {n}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, label_values, amount=1):
+        self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self.series.items()):
+            lines.append(f'{self.name}{{{_labels(self.labels, label_values)}}} {value}')
+        return lines
+
+def _labels(names, values):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+class Metrics:
+    """All metrics of one app, guarded by a single lock."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_latency = Histogram(
+            'mymeds_request_duration_seconds', 'Request latency by endpoint.',
+            ('endpoint', 'method', 'status'), LATENCY_BUCKETS)
+        self.request_queries = Histogram(
+            'mymeds_request_sql_queries', 'SQL statements executed per request.',
+            ('endpoint', 'method'), QUERY_BUCKETS)
+        self.budget_exceeded = Counter(
+            'mymeds_query_budget_exceeded_total', 'Requests that ran more SQL statements than QUERY_BUDGET.',
+            ('endpoint', 'method'))
+        self.job_latency = Histogram(
+            'mymeds_job_duration_seconds', 'Scheduler job run time.', ('job',), JOB_BUCKETS)
+        self.job_queries = Histogram(
+            'mymeds_job_sql_queries', 'SQL statements executed per job run.', ('job',), QUERY_BUCKETS)
+        self.job_failures = Counter(
+            'mymeds_job_failures_total', 'Scheduler job runs that raised.', ('job',))
+        self.profiles = Counter(
+            'mymeds_profiles_total', 'Requests profiled with cProfile.', ('endpoint',))
+        # Callables returning extra exposition lines, e.g. the reminder dispatcher's
+        self.collectors = []
+
+    def record_request(self, endpoint, method, status, seconds, queries, over_budget):
+        with self._lock:
+            self.request_latency.observe((endpoint, method, status), seconds)
+            self.request_queries.observe((endpoint, method), queries)
+            if over_budget:
+                self.budget_exceeded.inc((endpoint, method))
+
+    def record_job(self, job, seconds, queries, failed):
+        with self._lock:
+            self.job_latency.observe((job,), seconds)
+            self.job_queries.observe((job,), queries)
+            if failed:
+                self.job_failures.inc((job,))
+
+    def record_profile(self, endpoint):
+        with self._lock:
+            self.profiles.inc((endpoint,))
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.request_latency, self.request_queries, self.budget_exceeded,
+                           self.job_latency, self.job_queries, self.job_failures, self.profiles):
+                lines.extend(metric.render())
+        for collect in self.collectors:
+            lines.extend(collect())
+        return '\n'.join(lines) + '\n'
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    holder = _query_count.get()
+    if holder is not None:
+        holder[0] += 1
+
+def get_metrics(app):
+    return app.extensions.get('metrics')
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+@metrics_blueprint.route('/metrics')
+def metrics_view():
+    """Prometheus text exposition; 404 for anything but local clients."""
+    if request.remote_addr not in current_app.config['METRICS_ALLOWED_IPS']:
+        abort(404)
+    return Response(get_metrics(current_app).render(), mimetype='text/plain; version=0.0.4')
+
+def init_instrumentation(app):
+    """Register the request hooks, the SQL statement counter and /metrics."""
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return
+    metrics = app.extensions['metrics'] = Metrics()
+    budget = app.config['QUERY_BUDGET']
+    sample_rate = app.config['PROFILE_SAMPLE_RATE']
+    profile_dir = app.config['PROFILE_DIR'] or os.path.join(app.instance_path, 'profiles')
+
+    with app.app_context():
+        if not event.contains(db.engine, 'before_cursor_execute', _count_query):
+            event.listen(db.engine, 'before_cursor_execute', _count_query)
+
+    @app.before_request
+    def start_request():
+        g.instrument_token = _query_count.set([0])
+        g.instrument_start = time.perf_counter()
+        g.instrument_profile = None
+        if sample_rate and random.random() < sample_rate:
+            import cProfile
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                g.instrument_profile = profile
+            except ValueError:
+                # Another profiler is already active on this thread
+                pass
+
+    @app.after_request
+    def remember_status(response):
+        g.instrument_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request(exc):
+        start = g.pop('instrument_start', None)
+        if start is None:
+            return
+        seconds = time.perf_counter() - start
+        profile = g.pop('instrument_profile', None)
+        if profile is not None:
+            profile.disable()
+        holder = _query_count.get()
+        queries = holder[0] if holder else 0
+        try:
+            _query_count.reset(g.pop('instrument_token'))
+        except ValueError:
+            # Torn down from a different context than the one that started it
+            _query_count.set(None)
+
+        endpoint = request.endpoint or 'unmatched'
+        if endpoint in ('metrics.metrics_view', 'static'):
+            return
+        status = 500 if exc is not None else g.pop('instrument_status', 500)
+        over_budget = queries > budget
+        if over_budget:
+            logger.warning(f"{request.method} {request.path} ran {queries} SQL statements (budget {budget})")
+        metrics.record_request(endpoint, request.method, str(status), seconds, queries, over_budget)
+
+        if profile is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+            name = f"{endpoint}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{id(profile):x}.prof"
+            profile.dump_stats(os.path.join(profile_dir, name))
+            metrics.record_profile(endpoint)
+
+    app.register_blueprint(metrics_blueprint)
+
+def instrumented_job(app, name, fn):
+    """Wrap a scheduler job so its run time, SQL statements and failures are recorded."""
+    def run():
+        metrics = get_metrics(app)
+        if metrics is None:
+            return fn()
+        token = _query_count.set([0])
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = fn()
+            failed = False
+            return result
+        finally:
+            queries = _query_count.get()[0]
+            _query_count.reset(token)
+            metrics.record_job(name, time.perf_counter() - start, queries, failed)
+    return run
@@ -0,0 +1,201 @@
+import smtplib
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from email.message import EmailMessage
+from queue import LifoQueue, Empty
+
+logger = logging.getLogger(__name__)
+
+def build_message(sender, to_email, subject, body):
+    msg = EmailMessage()
+    msg.set_content(body)
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg['To'] = to_email
+    return msg
+
+def smtp_connector(host, port, user, password, timeout=30):
+    """Factory for authenticated smtplib connections, used by the pool."""
+    def connect():
+        server = smtplib.SMTP(host, port, timeout=timeout)
+        try:
+            server.starttls()
+            server.login(user, password)
+        except Exception:
+            server.close()
+            raise
+        return server
+    return connect
+
+def _close_quietly(conn):
+    try:
+        conn.quit()
+    except Exception:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+class SMTPConnectionPool:
+    """
+    Bounded pool of long-lived SMTP connections. A connection that raises while
+    checked out is discarded, so the next checkout reconnects.
+    """
+    def __init__(self, connect, size):
+        self._connect = connect
+        self._idle = LifoQueue(maxsize=size)
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            except Exception:
+                _close_quietly(conn)
+                raise
+            self._idle.put_nowait(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                _close_quietly(self._idle.get_nowait())
+            except Empty:
+                return
+
+class RateLimiter:
+    """Spaces sends evenly across all threads. rate is messages per second; <= 0 disables it."""
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+class Mailer:
+    """Sends messages in parallel over a pooled set of SMTP connections."""
+    def __init__(self, connect, sender, pool_size=4, rate_limit=0, retries=1):
+        self.sender = sender
+        self.retries = retries
+        self.pool = SMTPConnectionPool(connect, pool_size)
+        self.limiter = RateLimiter(rate_limit)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='smtp')
+
+    def send(self, to_email, subject, body):
+        msg = build_message(self.sender, to_email, subject, body)
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            try:
+                with self.pool.connection() as conn:
+                    try:
+                        conn.send_message(msg)
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                        if getattr(e, 'smtp_code', None) == 421:
+                            raise # server is closing the connection
+                        # The server refused this message; the connection is fine and goes back to the pool
+                        logger.error(f"Failed to send email to {to_email}: {e}")
+                        return False
+                return True
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError) as e:
+                # The pool dropped the broken connection; retry on a fresh one
+                logger.warning(f"SMTP connection failed (attempt {attempt + 1}): {e}")
+            except smtplib.SMTPException as e:
+                logger.error(f"Failed to send email to {to_email}: {e}")
+                return False
+            except OSError as e:
+                # Socket errors (SMTPException is an OSError too, so this comes last)
+                logger.warning(f"SMTP connection failed (attempt {attempt + 1}): {e}")
+        return False
+
+    def send_many(self, messages):
+        """
+        messages: iterable of (key, to_email, subject, body).
+        Yields (key, ok) as sends complete.
+        """
+        futures = {
+            self.executor.submit(self.send, to_email, subject, body): key
+            for key, to_email, subject, body in messages
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+
+class SMTPSink:
+    """
+    Local stand-in for an SMTP server: accepts and records messages without any
+    network I/O. latency simulates per-message server time for throughput tests.
+    """
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.messages = []
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def connect(self):
+        with self._lock:
+            self.connections += 1
+        return _SinkConnection(self)
+
+class _SinkConnection:
+    def __init__(self, sink):
+        self.sink = sink
+
+    def send_message(self, msg):
+        if self.sink.latency:
+            time.sleep(self.sink.latency)
+        with self.sink._lock:
+            self.sink.messages.append(msg)
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+_init_lock = threading.Lock()
+
+def get_mailer(app):
+    """
+    The app's shared Mailer, created on first use. Returns None when the SMTP
+    backend is selected but credentials are not configured.
+    """
+    with _init_lock:
+        if 'mailer' in app.extensions:
+            return app.extensions['mailer']
+
+        cfg = app.config
+        if cfg['SMTP_BACKEND'] == 'sink':
+            sink = SMTPSink(cfg['SMTP_SINK_LATENCY'])
+            app.extensions['smtp_sink'] = sink
+            connect = sink.connect
+        elif cfg['SMTP_USER'] and cfg['SMTP_PASS']:
+            connect = smtp_connector(cfg['SMTP_HOST'], cfg['SMTP_PORT'], cfg['SMTP_USER'],
+                                     cfg['SMTP_PASS'], cfg['SMTP_TIMEOUT'])
+        else:
+            logger.warning("SMTP credentials not set. Skipping email.")
+            return None
+
+        mailer = Mailer(connect, cfg['SMTP_USER'] or 'mymeds@localhost', cfg['SMTP_POOL_SIZE'], cfg['SMTP_RATE_LIMIT'])
+        app.extensions['mailer'] = mailer
+        return mailer
@@ -0,0 +1,103 @@
+import json
+import os
+
+DEFAULT_LEXICON = os.path.join(os.path.dirname(__file__), 'data', 'chat_lexicon.json')
+
+# Output kinds stored in the automaton
+CRISIS, INTENT, SENTIMENT = range(3)
+
+def _is_word(ch):
+    # Same characters as \w
+    return ch.isalnum() or ch == '_'
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over every lexicon term, built once per lexicon
+    file on first use (see chatbot.get_matcher).
+    One pass over the lowercased message finds crisis and intent terms
+    anywhere in the text (substring match, as before) and sentiment terms as
+    whole words, so the cost depends on message length, not lexicon size.
+    """
+    def __init__(self, crisis=(), negative=(), positive=(), intents=None):
+        intents = intents or {}
+        self.intent_names = list(intents) # earlier intents win
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for term in crisis:
+            self._add(term, (CRISIS, None, len(term)))
+        for priority, name in enumerate(self.intent_names):
+            for term in intents[name]:
+                self._add(term, (INTENT, priority, len(term)))
+        for term in negative:
+            self._add(term, (SENTIMENT, -0.5, len(term)))
+        for term in positive:
+            self._add(term, (SENTIMENT, 0.5, len(term)))
+        self._build()
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_LEXICON):
+        with open(path, encoding='utf-8') as f:
+            lexicon = json.load(f)
+        return cls(lexicon.get('crisis', ()), lexicon.get('negative', ()),
+                   lexicon.get('positive', ()), lexicon.get('intents'))
+
+    def _add(self, term, output):
+        state = 0
+        for ch in term.lower():
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append(output)
+
+    def _build(self):
+        # Breadth-first fail links; each state's outputs include those of its
+        # fail chain so matching never walks the chain for outputs
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt].extend(self._out[self._fail[nxt]])
+                queue.append(nxt)
+        self._out = tuple(tuple(out) for out in self._out)
+
+    def match(self, text):
+        """
+        Returns (crisis, intent, score) for a message: whether any crisis term
+        occurs, the highest-priority intent found (or None) and the sentiment
+        score clamped to [-1, 1].
+        """
+        text = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        last = len(text) - 1
+        state = 0
+        crisis = False
+        intent = None
+        score = 0.0
+
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for kind, value, length in out[state]:
+                if kind == SENTIMENT:
+                    start = i - length + 1
+                    if (start == 0 or not _is_word(text[start - 1])) and (i == last or not _is_word(text[i + 1])):
+                        score += value
+                elif kind == CRISIS:
+                    crisis = True
+                elif intent is None or value < intent:
+                    intent = value
+
+        return (crisis,
+                self.intent_names[intent] if intent is not None else None,
+                max(min(score, 1.0), -1.0))
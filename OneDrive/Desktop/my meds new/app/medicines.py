@@ -1,8 +1,10 @@
-from flask import Blueprint, request, jsonify, render_template, flash, redirect, url_for
+from flask import Blueprint, Response, request, jsonify, render_template, flash, redirect, url_for, stream_with_context
 from flask_login import login_required, current_user
-from app.models import Medicine, DoseLog, db, ReminderQueue
-from app.utils import calculate_adherence
-from datetime import datetime
+from app.models import Medicine, DoseLog, db, ReminderQueue, validate_times
+from app.utils import calculate_adherence, calculate_user_adherence, rebuild_adherence_summary, record_dose
+from app.reminders import purge_reminders, schedule_medicine
+from app import transfer
+from datetime import datetime, timedelta
 
 medicines = Blueprint('medicines', __name__)
 
@@ -10,11 +12,12 @@ medicines = Blueprint('medicines', __name__)
 @login_required
 def index():
     user_medicines = Medicine.query.filter_by(user_id=current_user.id).all()
+    adherence = calculate_user_adherence(current_user.id, user_medicines)
     meds_data = []
     for med in user_medicines:
         meds_data.append({
             'medicine': med,
-            'adherence': calculate_adherence(med.id)
+            'adherence': adherence[med.id]
         })
     return render_template('medicines.html', medicines=meds_data)
 
@@ -27,9 +30,8 @@ def api_medicines():
             return jsonify({'error': 'No data'}), 400
             
         try:
-            times = data.get('times', [])
-            import json
-            times_json = json.dumps(times)
+            # Validated once here; hot paths read the precomputed minutes
+            minutes = validate_times(data.get('times', []))
             
             start_date = datetime.strptime(data.get('start_date'), '%Y-%m-%d')
             end_date = datetime.strptime(data.get('end_date'), '%Y-%m-%d') if data.get('end_date') else None
@@ -38,15 +40,16 @@ def api_medicines():
                 user_id=current_user.id,
                 name=data['name'],
                 dose=data['dose'],
-                times=times_json,
                 start_date=start_date,
                 end_date=end_date
             )
+            med.set_schedule(minutes)
+            rebuild_adherence_summary(med, 0)
             db.session.add(med)
             db.session.commit()
             
-            # Trigger scheduler update or queue reminders (handled by background job usually, 
-            # but for MVP we might just let the cron pick it up)
+            # Queue upcoming reminders now instead of waiting for the horizon job
+            schedule_medicine(med.id)
             
             return jsonify({'message': 'Medicine added', 'id': med.id}), 201
         except Exception as e:
@@ -54,14 +57,15 @@ def api_medicines():
             
     # GET list
     meds = Medicine.query.filter_by(user_id=current_user.id).all()
+    adherence = calculate_user_adherence(current_user.id, meds)
     results = []
     for m in meds:
         results.append({
             'id': m.id,
             'name': m.name,
             'dose': m.dose,
-            'times': m.get_times_list(),
-            'adherence': calculate_adherence(m.id)
+            'times': m.get_slot_times(),
+            'adherence': adherence[m.id]
         })
     return jsonify(results)
 
@@ -84,6 +88,7 @@ def log_dose(id):
         taken=data.get('taken', True)
     )
     db.session.add(log)
+    record_dose(med, log)
     db.session.commit()
     
     return jsonify({'message': 'Dose logged', 'adherence': calculate_adherence(med.id)})
@@ -95,6 +100,103 @@ def delete_medicine(id):
     if med.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
         
+    purge_reminders(med.id)
     db.session.delete(med)
     db.session.commit()
-    return jsonify({'message': 'Deleted'})
\ No newline at end of file
+    return jsonify({'message': 'Deleted'})
+
+@medicines.route('/api/medicines/<int:id>', methods=['PATCH'])
+@login_required
+def update_medicine(id):
+    med = Medicine.query.get_or_404(id)
+    if med.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    data = request.get_json() or {}
+    if 'end_date' in data:
+        try:
+            med.end_date = datetime.strptime(data['end_date'], '%Y-%m-%d') if data['end_date'] else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid date format'}), 400
+        # Ending a medicine drops reminders queued past its new end date
+        if med.end_date:
+            purge_reminders(med.id, after=med.end_date)
+    db.session.commit()
+
+    schedule_medicine(med.id)
+    return jsonify({'message': 'Medicine updated'})
+
+# Default look-back per bucket when no start date is given, and the longest range served
+SERIES_DEFAULT_DAYS = {'day': 90, 'week': 182, 'month': 730}
+SERIES_MAX_DAYS = 3660
+
+@medicines.route('/api/medicines/<int:id>/adherence/series')
+@login_required
+def adherence_series(id):
+    """
+    Adherence per day, week or month between ?start and ?end (YYYY-MM-DD),
+    with streaks and missed doses per weekday and time slot.
+    """
+    # NumPy is only imported once analytics are first requested
+    from app import analytics
+    med = Medicine.query.get_or_404(id)
+    if med.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in analytics.BUCKETS:
+        return jsonify({'error': 'bucket must be day, week or month'}), 400
+    try:
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') if request.args.get('end') else datetime.utcnow()
+        if request.args.get('start'):
+            start = datetime.strptime(request.args['start'], '%Y-%m-%d')
+        else:
+            start = end - timedelta(days=SERIES_DEFAULT_DAYS[bucket] - 1)
+            if med.start_date and med.start_date > start:
+                start = med.start_date
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    if start > end or (end - start).days >= SERIES_MAX_DAYS:
+        return jsonify({'error': f'start must be before end and at most {SERIES_MAX_DAYS} days apart'}), 400
+
+    return jsonify(analytics.medicine_series(med, start, end, bucket))
+
+def _transfer_format():
+    if request.args.get('format') in ('csv', 'ndjson'):
+        return request.args['format']
+    return 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+
+@medicines.route('/api/import/<kind>', methods=['POST'])
+@login_required
+def import_history(kind):
+    """
+    Stream CSV (text/csv) or NDJSON medicines or dose logs in the request
+    body. Valid rows are inserted in chunked transactions; invalid rows are
+    reported without aborting the import.
+    """
+    if kind not in ('medicines', 'doses'):
+        return jsonify({'error': 'Unknown import kind'}), 404
+    rows = transfer.iter_rows(request.stream, _transfer_format())
+    if kind == 'medicines':
+        report = transfer.import_medicines(current_user.id, rows)
+    else:
+        report = transfer.import_dose_logs(current_user.id, rows)
+    return jsonify(report.to_dict())
+
+@medicines.route('/api/export/<kind>')
+@login_required
+def export_history(kind):
+    """Stream the user's medicines or full dose history as NDJSON or CSV."""
+    fmt = _transfer_format()
+    user_id = current_user.id
+    if kind == 'medicines':
+        records, fields = transfer.iter_medicine_records(user_id), transfer.MEDICINE_FIELDS
+    elif kind == 'doses':
+        records, fields = transfer.iter_dose_records(user_id), transfer.DOSE_FIELDS
+    else:
+        return jsonify({'error': 'Unknown export kind'}), 404
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(transfer.render_records(records, fmt, fields)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={kind}.{fmt}'
+    return response
@@ -2,7 +2,7 @@ from datetime import datetime
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import Integer, String, Boolean, DateTime, ForeignKey, Time, Text
+from sqlalchemy import Integer, String, Boolean, DateTime, ForeignKey, Time, Text, Index
 import json
 
 class Base(DeclarativeBase):
@@ -10,16 +10,61 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
+def parse_time_slots(times):
+    """
+    Lenient parse of legacy "HH:MM" lists into sorted minutes since midnight;
+    invalid entries are dropped. New schedules go through validate_times.
+    """
+    slots = []
+    for time_str in times:
+        try:
+            h, m = map(int, time_str.split(':'))
+        except (ValueError, AttributeError):
+            continue
+        if 0 <= h < 24 and 0 <= m < 60:
+            slots.append(h * 60 + m)
+    slots.sort()
+    return slots
+
+def validate_times(times):
+    """Strict parse of a list of "HH:MM" strings. Raises ValueError on any bad entry."""
+    if not isinstance(times, list):
+        raise ValueError('times must be a list of "HH:MM" strings')
+    minutes = set()
+    for time_str in times:
+        parsed = parse_time_slots([time_str])
+        if not parsed:
+            raise ValueError(f'Invalid time: {time_str!r}')
+        minutes.add(parsed[0])
+    return sorted(minutes)
+
+def format_minutes(minutes):
+    return ['%02d:%02d' % divmod(m, 60) for m in minutes]
+
+def pack_minutes(minutes):
+    return ','.join(str(m) for m in minutes)
+
+def schedule_minutes(slot_minutes, times):
+    # Packed form when present; rows not yet migrated fall back to the JSON
+    if slot_minutes is not None:
+        return [int(m) for m in slot_minutes.split(',')] if slot_minutes else []
+    try:
+        return parse_time_slots(json.loads(times))
+    except (TypeError, ValueError):
+        return []
+
 class User(UserMixin, db.Model):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     email: Mapped[str] = mapped_column(String(120), unique=True, index=True, nullable=False)
     password_hash: Mapped[str] = mapped_column(String(128), nullable=False)
     name: Mapped[str] = mapped_column(String(100), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    reminder_digest: Mapped[bool] = mapped_column(Boolean, nullable=True) # NULL follows Config.REMINDER_DIGEST
+    calendar_token: Mapped[str] = mapped_column(String(64), unique=True, index=True, nullable=True) # secret of the .ics feed URL; NULL = no feed
 
 class Medicine(db.Model):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('user.id'), nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('user.id'), nullable=False, index=True)
     name: Mapped[str] = mapped_column(String(100), nullable=False)
     dose: Mapped[str] = mapped_column(String(50), nullable=False)
     times: Mapped[str] = mapped_column(String(500), nullable=False)  # JSON string of list of times ["09:00", "21:00"]
@@ -27,31 +72,84 @@ class Medicine(db.Model):
     end_date: Mapped[datetime] = mapped_column(DateTime, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+    # Materialized adherence summary, kept current by log_dose (see utils.record_dose)
+    taken_count: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    scheduled_count: Mapped[int] = mapped_column(Integer, default=0, server_default='0') # scheduled doses up to adherence_watermark
+    adherence_watermark: Mapped[datetime] = mapped_column(DateTime, nullable=True) # NULL until the summary is built
+
+    # Validated schedule: sorted minutes since midnight packed as "540,1260".
+    # NULL only for rows not yet migrated from times (see schema.migrate_schedules)
+    slot_minutes: Mapped[str] = mapped_column(String(200), nullable=True)
+
     def get_times_list(self):
         try:
             return json.loads(self.times)
-        except:
+        except (TypeError, ValueError):
             return []
 
+    def get_slot_minutes(self):
+        return schedule_minutes(self.slot_minutes, self.times)
+
+    def get_slot_times(self):
+        """Validated schedule as "HH:MM" strings, from the packed column (no JSON parsing)."""
+        return format_minutes(self.get_slot_minutes())
+
+    def set_schedule(self, minutes):
+        """Store validated minutes in both forms: times JSON and the packed column."""
+        minutes = sorted(set(minutes))
+        self.times = json.dumps(format_minutes(minutes))
+        self.slot_minutes = pack_minutes(minutes)
+
 class DoseLog(db.Model):
+    __table_args__ = (
+        # Taken-dose counts per medicine
+        Index('ix_dose_log_medicine_taken', 'medicine_id', 'taken'),
+    )
+
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     medicine_id: Mapped[int] = mapped_column(Integer, ForeignKey('medicine.id'), nullable=False)
     scheduled_datetime: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     taken: Mapped[bool] = mapped_column(Boolean, default=False)
     logged_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+class DoseRollup(db.Model):
+    """
+    Per-medicine, per-month totals of DoseLog rows archived by app.retention.
+    Taken counts here still count towards adherence.
+    """
+    medicine_id: Mapped[int] = mapped_column(Integer, ForeignKey('medicine.id'), primary_key=True)
+    month: Mapped[datetime] = mapped_column(DateTime, primary_key=True) # first day of the month of scheduled_datetime
+    taken_count: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    logged_count: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+
 class Appointment(db.Model):
+    __table_args__ = (
+        # Conflict checks and listings are range scans per user
+        Index('ix_appointment_user_datetime', 'user_id', 'appointment_datetime'),
+    )
+
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey('user.id'), nullable=False)
     title: Mapped[str] = mapped_column(String(100), nullable=False)
     description: Mapped[str] = mapped_column(String(255), nullable=True)
     appointment_datetime: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    end_datetime: Mapped[datetime] = mapped_column(DateTime, nullable=True) # NULL for rows booked before durations existed
     status: Mapped[str] = mapped_column(String(20), default='scheduled') # scheduled, cancelled, completed
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 class ReminderQueue(db.Model):
+    __table_args__ = (
+        # One reminder per dose; makes planning idempotent
+        Index('ix_reminder_queue_medicine_send_at', 'medicine_id', 'send_at', unique=True),
+        # Due-reminder scans
+        Index('ix_reminder_queue_sent_send_at', 'sent', 'send_at'),
+    )
+
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     medicine_id: Mapped[int] = mapped_column(Integer, ForeignKey('medicine.id'), nullable=False)
     send_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     sent: Mapped[bool] = mapped_column(Boolean, default=False)
-    attempts: Mapped[int] = mapped_column(Integer, default=0)
\ No newline at end of file
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    # Lease held by the worker currently sending this reminder (see reminders.claim_due_reminders)
+    claimed_by: Mapped[str] = mapped_column(String(64), nullable=True)
+    claim_expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
\ No newline at end of file
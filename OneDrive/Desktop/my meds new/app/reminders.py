@@ -1,21 +1,35 @@
-import smtplib
-from email.message import EmailMessage
-from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime, timedelta
-from app.models import db, Medicine, ReminderQueue, User
+from app.models import db, Medicine, ReminderQueue, User, schedule_minutes
 from app.config import Config
+from sqlalchemy import and_, func, insert, or_, select, update
+from itertools import groupby
+from operator import attrgetter
+from string import Template
+from uuid import uuid4
 import logging
+import os
+import socket
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the entry points (run.py, worker.py); apscheduler,
+# smtplib and app.mailer are imported where used to keep app startup light
 logger = logging.getLogger(__name__)
 
+# How far ahead reminders are materialized into ReminderQueue
+LOOKAHEAD = timedelta(hours=24)
+# Delivery attempts before a reminder is given up on
+MAX_ATTEMPTS = 3
+
+REMINDER_SUBJECT = Template("MyMeds Reminder: $medicine at $time")
+REMINDER_BODY = Template("Hello $name,\n\nIt's time to take your $medicine ($dose).\n\nPlease log it in your dashboard.")
+DIGEST_SUBJECT = Template("MyMeds Reminder: $count medicines at $time")
+DIGEST_BODY = Template("Hello $name,\n\nIt's time to take:\n$items\nPlease log them in your dashboard.")
+DIGEST_ITEM = Template("- $medicine ($dose)\n")
+
 def send_email(to_email, subject, body):
-    msg = EmailMessage()
-    msg.set_content(body)
-    msg['Subject'] = subject
-    msg['From'] = Config.SMTP_USER
-    msg['To'] = to_email
+    """One-off send on its own connection. Bulk delivery goes through app.mailer."""
+    import smtplib
+    from app.mailer import build_message
+    msg = build_message(Config.SMTP_USER, to_email, subject, body)
 
     try:
         if not Config.SMTP_USER or not Config.SMTP_PASS:
@@ -31,89 +45,341 @@ def send_email(to_email, subject, body):
         logger.error(f"Failed to send email: {e}")
         return False
 
+def plan_occurrences(medicine_rows, window_start, window_end):
+    """
+    Yield (medicine_id, send_at) for every dose in [window_start, window_end],
+    computed in memory. Occurrences outside a medicine's start_date/end_date
+    range are skipped.
+    """
+    first_day = datetime.combine(window_start.date(), datetime.min.time())
+    days = [first_day + timedelta(days=i) for i in range((window_end.date() - window_start.date()).days + 1)]
+
+    for med_id, slot_minutes, times, start_date, end_date in medicine_rows:
+        slots = schedule_minutes(slot_minutes, times)
+        lower = max(window_start, start_date) if start_date else window_start
+        upper = min(window_end, end_date) if end_date else window_end
+        if not slots or lower > upper:
+            continue
+        for day in days:
+            for minute in slots:
+                send_at = day + timedelta(minutes=minute)
+                if lower <= send_at <= upper:
+                    yield med_id, send_at
+
+def queue_reminders(window_start, window_end, medicine_ids=None):
+    """
+    Materialize ReminderQueue rows for every dose in the window with one read of
+    the active medicines, one read of the already-queued (medicine_id, send_at)
+    pairs and one bulk insert, committed as a single transaction.
+    Returns the number of rows inserted.
+    """
+    meds = db.session.query(Medicine.id, Medicine.slot_minutes, Medicine.times, Medicine.start_date, Medicine.end_date).filter(
+        or_(Medicine.start_date == None, Medicine.start_date <= window_end),
+        or_(Medicine.end_date == None, Medicine.end_date >= window_start)
+    )
+    queued = db.session.query(ReminderQueue.medicine_id, ReminderQueue.send_at).filter(
+        ReminderQueue.send_at >= window_start,
+        ReminderQueue.send_at <= window_end
+    )
+    if medicine_ids is not None:
+        meds = meds.filter(Medicine.id.in_(medicine_ids))
+        queued = queued.filter(ReminderQueue.medicine_id.in_(medicine_ids))
+
+    existing = set(queued.all())
+    missing = [
+        {'medicine_id': med_id, 'send_at': send_at, 'sent': False, 'attempts': 0}
+        for med_id, send_at in plan_occurrences(meds.yield_per(1000), window_start, window_end)
+        if (med_id, send_at) not in existing
+    ]
+    if missing:
+        # OR IGNORE + the unique (medicine_id, send_at) index keeps concurrent planners idempotent
+        db.session.execute(insert(ReminderQueue).prefix_with('OR IGNORE', dialect='sqlite'), missing)
+    db.session.commit()
+    if missing:
+        from app.dispatcher import notify_planned
+        notify_planned()
+    return len(missing)
+
+def schedule_medicine(medicine_id):
+    """Queue the upcoming doses of a new or changed medicine right away."""
+    now = datetime.utcnow()
+    return queue_reminders(now, now + LOOKAHEAD, medicine_ids=[medicine_id])
+
+def purge_reminders(medicine_id, after=None):
+    """
+    Delete a medicine's unsent reminders, or only those after a moment such as
+    its new end_date. Runs in the caller's transaction.
+    """
+    query = ReminderQueue.query.filter(
+        ReminderQueue.medicine_id == medicine_id,
+        ReminderQueue.sent == False
+    )
+    if after is not None:
+        query = query.filter(ReminderQueue.send_at > after)
+    return query.delete(synchronize_session=False)
+
 def scan_and_queue_reminders(app):
     """
-    Scans medicines and ensures ReminderQueue has entries for upcoming doses.
-    For simplicity, look at today's schedule and check if queued.
+    Horizon extension: rolls ReminderQueue forward so it covers the next LOOKAHEAD.
+    New, changed and deleted medicines are handled when they change
+    (see schedule_medicine / purge_reminders), so this only needs to run
+    every REMINDER_HORIZON_INTERVAL_MINUTES.
     """
     with app.app_context():
         now = datetime.utcnow()
-        # Look ahead 24 hours
-        end_time = now + timedelta(hours=24)
-        
-        medicines = Medicine.query.all()
-        for med in medicines:
-            times = med.get_times_list()
-            if not times: continue
-            
-            # Simple check for "today" and "tomorrow" in UTC
-            # This is a naive implementation. Correct way is to generate all occurrences between now and end_time
-            # and check if they exist in ReminderQueue
-            
-            check_days = [now.date(), (now + timedelta(days=1)).date()]
-            
-            for day in check_days:
-                for time_str in times:
-                    try:
-                        h, m = map(int, time_str.split(':'))
-                        # Construct scheduled datetime
-                        scheduled_dt = datetime.combine(day, datetime.min.time()).replace(hour=h, minute=m)
-                        
-                        if scheduled_dt < now:
-                            continue # Already passed
-                            
-                        if scheduled_dt > end_time:
-                            continue # Too far ahead
-                            
-                        # Check existence
-                        exists = ReminderQueue.query.filter_by(
-                            medicine_id=med.id, 
-                            send_at=scheduled_dt
-                        ).first()
-                        
-                        if not exists:
-                            item = ReminderQueue(medicine_id=med.id, send_at=scheduled_dt)
-                            db.session.add(item)
-                    except:
-                        continue
-            db.session.commit()
-
-def process_reminder_queue(app):
-    """
-    Sends pending emails.
+        queued = queue_reminders(now, now + LOOKAHEAD)
+        if queued:
+            logger.info(f"Queued {queued} reminders")
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _due_filter(now, digest_default=False, digest_window=None):
+    # For users in digest mode, reminders up to digest_window ahead count as
+    # due so they can join a digest that is already due
+    due = ReminderQueue.send_at <= now
+    if digest_window:
+        digest = func.coalesce(User.reminder_digest, digest_default) == True
+        due = or_(due, and_(digest, ReminderQueue.send_at <= now + digest_window))
+    return and_(due, ReminderQueue.sent == False, ReminderQueue.attempts < MAX_ATTEMPTS)
+
+def _claimable(now):
+    # Unclaimed, or the lease of a worker that crashed or stalled has expired
+    return or_(ReminderQueue.claimed_by == None, ReminderQueue.claim_expires_at < now)
+
+def claim_due_reminders(token, now, lease, after_user_id=0, max_users=200, digest_default=False, digest_window=None):
+    """
+    Lease the due reminders of the next max_users users (by id, after
+    after_user_id) to token, in a single UPDATE. Whole users are claimed so a
+    digest is never split between workers, and rows already leased by another
+    worker are skipped. Returns the number of rows claimed.
+    """
+    users = select(Medicine.user_id).select_from(ReminderQueue
+    ).join(Medicine, Medicine.id == ReminderQueue.medicine_id
+    ).join(User, User.id == Medicine.user_id
+    ).where(
+        Medicine.user_id > after_user_id,
+        _due_filter(now, digest_default, digest_window),
+        _claimable(now)
+    ).distinct().order_by(Medicine.user_id).limit(max_users)
+
+    ids = select(ReminderQueue.id
+    ).join(Medicine, Medicine.id == ReminderQueue.medicine_id
+    ).join(User, User.id == Medicine.user_id
+    ).where(
+        Medicine.user_id.in_(users),
+        _due_filter(now, digest_default, digest_window)
+    )
+
+    result = db.session.execute(
+        update(ReminderQueue).where(ReminderQueue.id.in_(ids), _claimable(now)).values(
+            claimed_by=token, claim_expires_at=now + lease
+        ).execution_options(synchronize_session=False))
+    db.session.commit()
+    return result.rowcount
+
+def fetch_claimed_reminders(token, digest_default=False):
+    """
+    Reminders leased to token, joined with their medicine and user so
+    rendering needs no further lookups. Ordered by (user_id, id).
     """
+    return db.session.query(
+        ReminderQueue.id,
+        ReminderQueue.send_at,
+        Medicine.name.label('medicine'),
+        Medicine.dose,
+        Medicine.user_id,
+        User.name.label('user_name'),
+        User.email,
+        func.coalesce(User.reminder_digest, digest_default).label('digest')
+    ).join(Medicine, Medicine.id == ReminderQueue.medicine_id
+    ).join(User, User.id == Medicine.user_id
+    ).filter(
+        ReminderQueue.claimed_by == token
+    ).order_by(Medicine.user_id, ReminderQueue.id).all()
+
+def _record_results(token, sent_ids, attempted_ids, claimed_ids):
+    # Bulk UPDATEs instead of a commit per reminder; every lease is released.
+    # Digest rows that were claimed but not yet due are simply handed back.
+    # Only rows still leased to token are touched: another worker may have
+    # taken over an expired lease.
+    held = ReminderQueue.claimed_by == token
+    if sent_ids:
+        db.session.execute(update(ReminderQueue).where(ReminderQueue.id.in_(sent_ids), held).values(sent=True))
+    if attempted_ids:
+        db.session.execute(update(ReminderQueue).where(ReminderQueue.id.in_(attempted_ids), held).values(
+            attempts=ReminderQueue.attempts + 1))
+    db.session.execute(update(ReminderQueue).where(ReminderQueue.id.in_(claimed_ids), held).values(
+        claimed_by=None, claim_expires_at=None))
+    db.session.commit()
+
+def render_reminder(row):
+    """(subject, body) for a row from fetch_due_reminders."""
+    fields = {
+        'medicine': row.medicine,
+        'dose': row.dose,
+        'name': row.user_name,
+        'time': row.send_at.strftime('%H:%M')
+    }
+    return REMINDER_SUBJECT.substitute(fields), REMINDER_BODY.substitute(fields)
+
+def render_digest(rows):
+    """(subject, body) listing every medicine in a group of one user's reminders."""
+    items = ''.join(DIGEST_ITEM.substitute(medicine=row.medicine, dose=row.dose) for row in rows)
+    fields = {
+        'count': len(rows),
+        'name': rows[0].user_name,
+        'time': rows[0].send_at.strftime('%H:%M'),
+        'items': items
+    }
+    return DIGEST_SUBJECT.substitute(fields), DIGEST_BODY.substitute(fields)
+
+def build_messages(rows, now, window):
+    """
+    Turn one user-ordered chunk into (ids, email, subject, body) messages.
+    Digest users get one message per group of reminders whose send_at falls
+    within window of the group's first reminder; groups not yet due are left
+    for a later run.
+    """
+    messages = []
+    for _, user_rows in groupby(rows, key=attrgetter('user_id')):
+        user_rows = list(user_rows)
+        if not user_rows[0].digest:
+            messages.extend(((row.id,), row.email) + render_reminder(row) for row in user_rows)
+            continue
+
+        user_rows.sort(key=attrgetter('send_at'))
+        group = []
+        for row in user_rows + [None]:
+            if group and (row is None or row.send_at - group[0].send_at > window):
+                if group[0].send_at <= now:
+                    render = render_digest(group) if len(group) > 1 else render_reminder(group[0])
+                    messages.append((tuple(r.id for r in group), group[0].email) + render)
+                group = []
+            if row is not None:
+                group.append(row)
+    return messages
+
+def process_reminder_queue(app, worker_id=None):
+    """
+    Sends pending emails through the pooled mailer. Due reminders are leased
+    REMINDER_BATCH_SIZE users at a time, so several workers can drain the
+    queue without sending anything twice. In digest mode each user's
+    simultaneous reminders become one email. Returns the number of
+    reminders sent.
+    """
+    batch_size = app.config['REMINDER_BATCH_SIZE']
+    lease = timedelta(seconds=app.config['REMINDER_LEASE_SECONDS'])
+    digest_default = app.config['REMINDER_DIGEST']
+    window = timedelta(minutes=app.config['REMINDER_DIGEST_WINDOW_MINUTES'])
+    from app.mailer import get_mailer
+    worker_id = worker_id or default_worker_id()
+    mailer = get_mailer(app)
+    processed = sent = 0
+
     with app.app_context():
-        now = datetime.utcnow()
-        # Find pending items where send_at <= now
-        pending = ReminderQueue.query.filter(
-            ReminderQueue.send_at <= now,
-            ReminderQueue.sent == False,
-            ReminderQueue.attempts < 3
-        ).all()
-        
-        for item in pending:
-            item.attempts += 1
-            med = db.session.get(Medicine, item.medicine_id)
-            user = db.session.get(User, med.user_id)
-            
-            subject = f"MyMeds Reminder: {med.name} at {item.send_at.strftime('%H:%M')}"
-            body = f"Hello {user.name},\n\nIt's time to take your {med.name} ({med.dose}).\n\nPlease log it in your dashboard."
-            
-            if send_email(user.email, subject, body):
-                item.sent = True
-                logger.info(f"Sent reminder for {med.name} to {user.email}")
+        after_user_id = 0
+        while True:
+            # Per batch: a long drain must not hand out leases that have already expired
+            now = datetime.utcnow()
+            token = f"{worker_id}:{uuid4().hex[:8]}"
+            if not claim_due_reminders(token, now, lease, after_user_id, batch_size, digest_default, window):
+                break
+            rows = fetch_claimed_reminders(token, digest_default)
+            # Release the read transaction before the (slow) sends
+            db.session.close()
+            if not rows:
+                break
+            after_user_id = rows[-1].user_id
+            if datetime.utcnow() >= now + lease:
+                # Another worker may already be sending these; leave them to it
+                logger.warning(f"Lease of {len(rows)} reminders expired before sending; skipped")
+                _record_results(token, [], [], [row.id for row in rows])
+                continue
+
+            messages = build_messages(rows, now, window)
+            if mailer is None:
+                results = ((key, False) for key, _, _, _ in messages)
             else:
-                logger.error(f"Failed to send reminder for {med.name}")
-                
-            db.session.commit()
+                results = mailer.send_many(messages)
+
+            sent_ids, attempted_ids = [], []
+            for ids, ok in results:
+                attempted_ids.extend(ids)
+                if ok:
+                    sent_ids.extend(ids)
+            # All rows behind a digest are marked in the same transaction
+            _record_results(token, sent_ids, attempted_ids, [row.id for row in rows])
+            processed += len(attempted_ids)
+            sent += len(sent_ids)
+
+    if processed:
+        logger.info(f"Processed {processed} reminders")
+    return sent
+
+def start_dispatcher(app, worker_id=None):
+    """
+    Start the in-memory reminder dispatcher when REMINDER_DISPATCHER is set.
+    Returns it, or None when due reminders should be polled instead.
+    """
+    if not app.config['REMINDER_DISPATCHER']:
+        return None
+    from app.dispatcher import ReminderDispatcher
+    from app.instrumentation import get_metrics, instrumented_job
+    worker_id = worker_id or default_worker_id()
+    send = instrumented_job(app, 'process_reminder_queue', lambda: process_reminder_queue(app, worker_id))
+    dispatcher = ReminderDispatcher(app, worker_id, send).start()
+    app.extensions['reminder_dispatcher'] = dispatcher
+    metrics = get_metrics(app)
+    if metrics is not None:
+        metrics.collectors.append(dispatcher.metric_lines)
+    return dispatcher
+
+def run_worker(app, worker_id=None):
+    """
+    Standalone reminder worker (see worker.py), independent of the web
+    processes. Safe to run as several processes: queue rows are leased and
+    planning is idempotent.
+    """
+    from apscheduler.schedulers.blocking import BlockingScheduler
+    from app.instrumentation import instrumented_job
+    from app.retention import run_retention
+    worker_id = worker_id or default_worker_id()
+    scheduler = BlockingScheduler()
+    scheduler.add_job(instrumented_job(app, 'scan_and_queue_reminders', lambda: scan_and_queue_reminders(app)),
+                      'interval', minutes=app.config['REMINDER_HORIZON_INTERVAL_MINUTES'],
+                      next_run_time=datetime.now())
+    if not start_dispatcher(app, worker_id):
+        scheduler.add_job(instrumented_job(app, 'process_reminder_queue', lambda: process_reminder_queue(app, worker_id)),
+                          'interval', seconds=app.config['REMINDER_POLL_SECONDS'],
+                          next_run_time=datetime.now())
+    scheduler.add_job(instrumented_job(app, 'run_retention', lambda: run_retention(app)),
+                      'interval', hours=app.config['RETENTION_INTERVAL_HOURS'])
+    logger.info(f"Reminder worker {worker_id} started")
+    scheduler.start()
 
 def start_scheduler(app):
-    import os
+    """
+    In-process scheduler for the development server. Production deployments
+    set REMINDER_SCHEDULER_IN_APP=false and run worker.py instead.
+    """
+    if not app.config['REMINDER_SCHEDULER_IN_APP']:
+        return
     if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from apscheduler.schedulers.background import BackgroundScheduler
+        from app.instrumentation import instrumented_job
+        from app.retention import run_retention
         scheduler = BackgroundScheduler()
-        # Scan every minute
-        scheduler.add_job(lambda: scan_and_queue_reminders(app), 'interval', minutes=1)
-        # Process queue every minute (offset by 30s to avoid DB lock contention ideally, but simultaneous is fine for sqlite WAL)
-        scheduler.add_job(lambda: process_reminder_queue(app), 'interval', minutes=1)
+        # Extend the reminder horizon; also run once at startup
+        scheduler.add_job(instrumented_job(app, 'scan_and_queue_reminders', lambda: scan_and_queue_reminders(app)),
+                          'interval', minutes=app.config['REMINDER_HORIZON_INTERVAL_MINUTES'],
+                          next_run_time=datetime.now())
+        # Send due reminders; concurrent writes are fine with WAL + busy_timeout (app/database.py)
+        if not start_dispatcher(app):
+            scheduler.add_job(instrumented_job(app, 'process_reminder_queue', lambda: process_reminder_queue(app)),
+                              'interval', minutes=1)
+        # Roll up old dose logs and prune finished reminders
+        scheduler.add_job(instrumented_job(app, 'run_retention', lambda: run_retention(app)),
+                          'interval', hours=app.config['RETENTION_INTERVAL_HOURS'])
         scheduler.start()
         logger.info("Scheduler started")
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""
+Retention for the unbounded tables. Old DoseLog rows are folded into monthly
+DoseRollup rows (which adherence still counts) and finished ReminderQueue rows
+are deleted. Both work in small batches, one short transaction each, so the
+SQLite write lock is never held for long.
+"""
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from app.models import db, DoseLog, DoseRollup, ReminderQueue
+from app.reminders import MAX_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+def archive_dose_logs(before, batch_size=500):
+    """
+    Roll DoseLog rows scheduled before `before` up into DoseRollup and delete
+    them. Returns the number of rows archived.
+    """
+    archived = 0
+    while True:
+        rows = db.session.query(DoseLog.id, DoseLog.medicine_id, DoseLog.scheduled_datetime, DoseLog.taken).filter(
+            DoseLog.scheduled_datetime < before
+        ).order_by(DoseLog.id).limit(batch_size).all()
+        if not rows:
+            return archived
+
+        ids = [row.id for row in rows]
+        deleted = DoseLog.query.filter(DoseLog.id.in_(ids)).delete(synchronize_session=False)
+        if deleted != len(ids):
+            # Another process archived part of this batch first; start over from fresh rows
+            db.session.rollback()
+            continue
+
+        logged, taken = Counter(), Counter()
+        for row in rows:
+            key = (row.medicine_id, month_start(row.scheduled_datetime))
+            logged[key] += 1
+            if row.taken:
+                taken[key] += 1
+        for key, count in logged.items():
+            rollup = db.session.get(DoseRollup, key)
+            if rollup is None:
+                rollup = DoseRollup(medicine_id=key[0], month=key[1], taken_count=0, logged_count=0)
+                db.session.add(rollup)
+            rollup.taken_count += taken[key]
+            rollup.logged_count += count
+        db.session.commit()
+        archived += len(ids)
+
+def prune_reminders(before, batch_size=500):
+    """Delete sent or exhausted reminders due before `before`. Returns the number deleted."""
+    pruned = 0
+    while True:
+        ids = [rid for (rid,) in db.session.query(ReminderQueue.id).filter(
+            ReminderQueue.send_at < before,
+            or_(ReminderQueue.sent == True, ReminderQueue.attempts >= MAX_ATTEMPTS)
+        ).order_by(ReminderQueue.id).limit(batch_size)]
+        if not ids:
+            return pruned
+        pruned += ReminderQueue.query.filter(ReminderQueue.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+def apply_retention(config, now=None):
+    """Run both retention passes with the windows from config. Returns (archived, pruned)."""
+    now = now or datetime.utcnow()
+    batch_size = config['RETENTION_BATCH_SIZE']
+    # Whole months only, so a month's rollup is written once rather than topped up daily
+    dose_cutoff = month_start(now - timedelta(days=config['DOSE_LOG_RETENTION_DAYS']))
+    archived = archive_dose_logs(dose_cutoff, batch_size)
+    pruned = prune_reminders(now - timedelta(days=config['REMINDER_RETENTION_DAYS']), batch_size)
+    return archived, pruned
+
+def run_retention(app):
+    """Scheduler job wrapper around apply_retention."""
+    with app.app_context():
+        archived, pruned = apply_retention(app.config)
+        if archived or pruned:
+            logger.info(f"Archived {archived} dose logs, pruned {pruned} reminders")
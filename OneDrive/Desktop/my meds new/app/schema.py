@@ -0,0 +1,110 @@
+import hashlib
+from sqlalchemy import Column, MetaData, String, Table, inspect, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.elements import TextClause
+from app.models import db, Medicine, parse_time_slots
+
+# Tables no model uses any more; dropped by upgrade_schema
+RETIRED_TABLES = ('medicine_slot',)
+
+# Fingerprint of the models the database was last upgraded to. Kept outside
+# db.metadata so it is not part of the fingerprint itself.
+schema_state = Table('schema_state', MetaData(), Column('fingerprint', String(64), primary_key=True))
+
+def schema_fingerprint():
+    """Hash of every table's columns, types and indexes as declared by the models."""
+    parts = []
+    for table in db.metadata.sorted_tables:
+        columns = ','.join(f'{c.name}:{c.type}:{c.nullable}' for c in table.columns)
+        indexes = ','.join(sorted(i.name for i in table.indexes))
+        parts.append(f'{table.name}({columns})[{indexes}]')
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+def schema_is_current():
+    """True when the database was upgraded for exactly these models. One read, no DDL."""
+    try:
+        with db.engine.connect() as conn:
+            stored = conn.execute(select(schema_state.c.fingerprint)).scalar()
+    except DBAPIError:
+        return False
+    return stored == schema_fingerprint()
+
+def _default_sql(column):
+    default = column.server_default.arg
+    if isinstance(default, TextClause):
+        return default.text
+    return "'%s'" % str(default).replace("'", "''")
+
+def upgrade_schema(force=False):
+    """
+    Create missing tables, then add columns and indexes that were introduced
+    after a table was first created. db.create_all() never alters an existing
+    table, so databases from older versions would otherwise miss them.
+    New columns must be nullable or carry a server_default.
+
+    Skipped when the stored fingerprint matches the models, unless forced.
+    Returns True if the upgrade ran.
+    """
+    if not force and schema_is_current():
+        return False
+    db.create_all()
+
+    engine = db.engine
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = 'ALTER TABLE %s ADD COLUMN %s %s' % (
+                    quote(table.name), quote(column.name), column.type.compile(engine.dialect))
+                if column.server_default is not None:
+                    ddl += ' NOT NULL DEFAULT ' + _default_sql(column)
+                conn.execute(text(ddl))
+
+            existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                if index.unique:
+                    _drop_duplicates(conn, table, index, quote)
+                index.create(conn)
+
+    migrate_schedules()
+
+    with engine.begin() as conn:
+        for name in RETIRED_TABLES:
+            conn.execute(text('DROP TABLE IF EXISTS %s' % quote(name)))
+
+    with engine.begin() as conn:
+        schema_state.create(conn, checkfirst=True)
+        conn.execute(schema_state.delete())
+        conn.execute(schema_state.insert().values(fingerprint=schema_fingerprint()))
+    return True
+
+def _drop_duplicates(conn, table, index, quote):
+    # Rows written before a unique index existed may collide; keep the oldest of each group.
+    # NULLs never collide in a unique index, and GROUP BY would lump them together (e.g. a
+    # column added by this same upgrade), so rows with a NULL key are left alone.
+    cols = ', '.join(quote(c.name) for c in index.columns)
+    not_null = ' AND '.join('%s IS NOT NULL' % quote(c.name) for c in index.columns)
+    conn.execute(text('DELETE FROM %s WHERE %s AND id NOT IN (SELECT MIN(id) FROM %s WHERE %s GROUP BY %s)' % (
+        quote(table.name), not_null, quote(table.name), not_null, cols)))
+
+def migrate_schedules(batch_size=500):
+    """
+    Backfill the packed slot_minutes column for medicines that only have the
+    legacy times JSON. Invalid legacy entries, which were
+    always ignored, are dropped. Returns the number of medicines migrated.
+    """
+    migrated = 0
+    while True:
+        meds = Medicine.query.filter(Medicine.slot_minutes == None).limit(batch_size).all()
+        if not meds:
+            return migrated
+        for med in meds:
+            med.set_schedule(parse_time_slots(med.get_times_list()))
+        db.session.commit()
+        migrated += len(meds)
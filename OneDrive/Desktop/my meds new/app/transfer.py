@@ -0,0 +1,227 @@
+"""
+Streaming bulk import and export of medicines and dose history (CSV or NDJSON).
+
+Imports validate rows as they are read, insert them in chunked transactions
+and collect per-row errors without aborting the job. Exports are generators
+over server-side cursors, so neither side ever holds a full history in memory.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy import insert
+from app.models import db, DoseLog, Medicine, validate_times
+from app.reminders import LOOKAHEAD, queue_reminders
+from app.utils import rebuild_adherence_summary, taken_counts
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+
+MEDICINE_FIELDS = ['id', 'name', 'dose', 'times', 'start_date', 'end_date']
+DOSE_FIELDS = ['id', 'medicine_id', 'medicine', 'scheduled_datetime', 'taken', 'logged_at']
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'error': message})
+
+    def to_dict(self):
+        return {'imported': self.imported, 'failed': self.failed, 'errors': self.errors}
+
+def iter_rows(stream, fmt):
+    """Yield (row_number, dict) from a binary stream of CSV or NDJSON."""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            yield number, row
+        return
+    for number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else {'__invalid__': line}
+
+def _parse_date(value, required=False):
+    if value in (None, ''):
+        if required:
+            raise ValueError('missing date')
+        return None
+    return datetime.fromisoformat(value)
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value in (None, ''):
+        return True
+    if str(value).strip().lower() in ('1', 'true', 'yes', 'y', 't'):
+        return True
+    if str(value).strip().lower() in ('0', 'false', 'no', 'n', 'f'):
+        return False
+    raise ValueError(f'invalid boolean {value!r}')
+
+def _parse_times(value):
+    # NDJSON carries a list; CSV carries "09:00;21:00" or a JSON list
+    if isinstance(value, str):
+        value = json.loads(value) if value.startswith('[') else [t.strip() for t in value.split(';') if t.strip()]
+    return validate_times(value or [])
+
+def import_medicines(user_id, rows, chunk_size=CHUNK_SIZE):
+    report = ImportReport()
+    chunk = []
+    imported_ids = []
+
+    def flush():
+        db.session.add_all(chunk)
+        db.session.flush()
+        imported_ids.extend(med.id for med in chunk)
+        db.session.commit()
+        report.imported += len(chunk)
+        chunk.clear()
+
+    for number, row in rows:
+        try:
+            if '__invalid__' in row:
+                raise ValueError('invalid JSON')
+            if not row.get('name') or not row.get('dose'):
+                raise ValueError('name and dose are required')
+            med = Medicine(
+                user_id=user_id,
+                name=row['name'],
+                dose=row['dose'],
+                start_date=_parse_date(row.get('start_date'), required=True),
+                end_date=_parse_date(row.get('end_date'))
+            )
+            med.set_schedule(_parse_times(row.get('times')))
+            rebuild_adherence_summary(med, 0)
+        except (TypeError, ValueError) as e:
+            report.error(number, str(e))
+            continue
+        chunk.append(med)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    if imported_ids:
+        now = datetime.utcnow()
+        queue_reminders(now, now + LOOKAHEAD, medicine_ids=imported_ids)
+    return report
+
+def import_dose_logs(user_id, rows, chunk_size=CHUNK_SIZE):
+    """
+    Dose rows reference a medicine by 'medicine' name, or by 'medicine_id'
+    when no name is given. Exports carry both; the name wins because ids do
+    not carry over to another account or database.
+    Rows are inserted with Core executemany in chunks; adherence counters of
+    the touched medicines are rebuilt once at the end.
+    """
+    report = ImportReport()
+    meds = Medicine.query.filter_by(user_id=user_id).all()
+    by_id = {m.id: m for m in meds}
+    by_name = {m.name.lower(): m for m in meds}
+    touched = set()
+    chunk = []
+    now = datetime.utcnow()
+
+    def flush():
+        db.session.execute(insert(DoseLog), chunk)
+        db.session.commit()
+        report.imported += len(chunk)
+        chunk.clear()
+
+    for number, row in rows:
+        try:
+            if '__invalid__' in row:
+                raise ValueError('invalid JSON')
+            if row.get('medicine') not in (None, ''):
+                med = by_name.get(str(row['medicine']).lower())
+            elif row.get('medicine_id') not in (None, ''):
+                med = by_id.get(int(row['medicine_id']))
+            else:
+                med = None
+            if med is None:
+                raise ValueError('unknown medicine')
+            chunk.append({
+                'medicine_id': med.id,
+                'scheduled_datetime': _parse_date(row.get('scheduled_datetime'), required=True),
+                'taken': _parse_bool(row.get('taken')),
+                'logged_at': _parse_date(row.get('logged_at')) or now
+            })
+        except (TypeError, ValueError) as e:
+            report.error(number, str(e))
+            continue
+        touched.add(med.id)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    if touched:
+        counts = taken_counts(list(touched))
+        for medicine_id in touched:
+            rebuild_adherence_summary(by_id[medicine_id], counts.get(medicine_id, 0), now)
+        db.session.commit()
+    return report
+
+def _medicine_record(med):
+    return {
+        'id': med.id,
+        'name': med.name,
+        'dose': med.dose,
+        'times': med.get_slot_times(),
+        'start_date': med.start_date.isoformat() if med.start_date else None,
+        'end_date': med.end_date.isoformat() if med.end_date else None
+    }
+
+def _dose_record(row):
+    return {
+        'id': row.id,
+        'medicine_id': row.medicine_id,
+        'medicine': row.name,
+        'scheduled_datetime': row.scheduled_datetime.isoformat(),
+        'taken': bool(row.taken),
+        'logged_at': row.logged_at.isoformat() if row.logged_at else None
+    }
+
+def iter_medicine_records(user_id, batch_size=1000):
+    query = Medicine.query.filter_by(user_id=user_id).order_by(Medicine.id)
+    for med in query.yield_per(batch_size):
+        yield _medicine_record(med)
+
+def iter_dose_records(user_id, batch_size=1000):
+    query = db.session.query(
+        DoseLog.id, DoseLog.medicine_id, Medicine.name, DoseLog.scheduled_datetime, DoseLog.taken, DoseLog.logged_at
+    ).join(Medicine, Medicine.id == DoseLog.medicine_id).filter(
+        Medicine.user_id == user_id
+    ).order_by(DoseLog.id)
+    for row in query.yield_per(batch_size):
+        yield _dose_record(row)
+
+def render_records(records, fmt, fields):
+    """Serialize records lazily as NDJSON lines or CSV rows (with header)."""
+    if fmt != 'csv':
+        for record in records:
+            yield json.dumps(record) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for record in records:
+        if isinstance(record.get('times'), list):
+            record['times'] = ';'.join(record['times'])
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
@@ -1,6 +1,144 @@
-from datetime import datetime, timedelta
-from app.models import DoseLog, Medicine, db
-from sqlalchemy import  and_
+from bisect import bisect_right
+from datetime import datetime
+from app.models import DoseLog, DoseRollup, Medicine, db
+from sqlalchemy import  and_, func
+
+def _occurrences_through(slots, moment):
+    # Slot occurrences from an arbitrary epoch (day ordinal 0) up to and including moment
+    return moment.toordinal() * len(slots) + bisect_right(slots, moment.hour * 60 + moment.minute)
+
+def count_doses_between(slots, after, until):
+    """Number of scheduled doses in the half-open interval (after, until]."""
+    if not slots or until <= after:
+        return 0
+    return _occurrences_through(slots, until) - _occurrences_through(slots, after)
+
+def count_scheduled_doses(slots, start_date, end_date):
+    """
+    Number of scheduled doses from the start of start_date's day up to and
+    including end_date, computed arithmetically:
+    full days * slots per day + slots already passed on the last day.
+    """
+    if not slots or end_date is None:
+        return 0
+    if end_date.date() < start_date.date():
+        return 0
+    return _occurrences_through(slots, end_date) - start_date.toordinal() * len(slots)
+
+def adherence_window_end(medicine, now=None):
+    """Upper bound for scheduled doses: now, or end_date if therapy already ended."""
+    now = now or datetime.utcnow()
+    if medicine.end_date and medicine.end_date < now:
+        return medicine.end_date
+    return now
+
+def adherence_percent(medicine, scheduled_count, taken_count, end_date):
+    if scheduled_count == 0:
+        return 100.0 if medicine.start_date <= end_date else 0.0
+
+    if taken_count > scheduled_count:
+        return 100.0 # Cap at 100
+
+    return round((taken_count / scheduled_count) * 100, 1)
+
+def _taken_counts(medicine_ids=None):
+    logs = db.session.query(DoseLog.medicine_id, func.count(DoseLog.id)).filter(DoseLog.taken == True)
+    rollups = db.session.query(DoseRollup.medicine_id, func.sum(DoseRollup.taken_count))
+    if medicine_ids is not None:
+        logs = logs.filter(DoseLog.medicine_id.in_(medicine_ids))
+        rollups = rollups.filter(DoseRollup.medicine_id.in_(medicine_ids))
+    counts = dict(logs.group_by(DoseLog.medicine_id).all())
+    for medicine_id, taken in rollups.group_by(DoseRollup.medicine_id):
+        counts[medicine_id] = counts.get(medicine_id, 0) + (taken or 0)
+    return counts
+
+def taken_counts(medicine_ids):
+    """
+    Taken dose counts for many medicines: one grouped query over DoseLog plus
+    one over the monthly rollups of archived logs.
+    """
+    if not medicine_ids:
+        return {}
+    return _taken_counts(medicine_ids)
+
+def scheduled_through(medicine, slots, end_date):
+    """
+    Scheduled doses up to end_date. Uses the materialized count and only adds
+    the slots that passed since the watermark.
+    """
+    watermark = medicine.adherence_watermark
+    if watermark is None or end_date < watermark:
+        return count_scheduled_doses(slots, medicine.start_date, end_date)
+    if watermark.date() < medicine.start_date.date():
+        # Summary built before the therapy started: count from start_date, not the watermark
+        return medicine.scheduled_count + count_scheduled_doses(slots, medicine.start_date, end_date)
+    return medicine.scheduled_count + count_doses_between(slots, watermark, end_date)
+
+def rebuild_adherence_summary(medicine, taken_count, now=None):
+    """Reset a medicine's adherence counters from an authoritative taken count."""
+    end_date = adherence_window_end(medicine, now)
+    slots = medicine.get_slot_minutes()
+    medicine.taken_count = taken_count
+    medicine.scheduled_count = count_scheduled_doses(slots, medicine.start_date, end_date) if medicine.start_date else 0
+    medicine.adherence_watermark = end_date
+
+def record_dose(medicine, log, now=None):
+    """
+    Update the adherence counters for a new DoseLog in the caller's transaction.
+    O(1): no DoseLog scan unless the summary was never built.
+    """
+    if medicine.adherence_watermark is None:
+        db.session.flush()
+        rebuild_adherence_summary(medicine, taken_counts([medicine.id]).get(medicine.id, 0), now)
+        return
+
+    end_date = adherence_window_end(medicine, now)
+    if medicine.start_date and end_date > medicine.adherence_watermark:
+        slots = medicine.get_slot_minutes()
+        medicine.scheduled_count = scheduled_through(medicine, slots, end_date)
+        medicine.adherence_watermark = end_date
+    if log.taken:
+        # Increment in SQL so concurrent logs for the same medicine don't lose updates
+        medicine.taken_count = Medicine.taken_count + 1
+
+def rebuild_all_adherence_summaries(batch_size=500):
+    """Recompute every medicine's counters from DoseLog and DoseRollup. Returns the number rebuilt."""
+    now = datetime.utcnow()
+    counts = _taken_counts()
+
+    rebuilt = 0
+    for med in Medicine.query.order_by(Medicine.id).yield_per(batch_size):
+        rebuild_adherence_summary(med, counts.get(med.id, 0), now)
+        rebuilt += 1
+        if rebuilt % batch_size == 0:
+            db.session.flush()
+    db.session.commit()
+    return rebuilt
+
+def calculate_user_adherence(user_id, medicines=None, now=None):
+    """
+    Adherence for every medicine of a user as {medicine_id: percent}.
+    Medicines with a materialized summary cost no extra queries; the rest
+    share one grouped DoseLog count, however long the therapy has been running.
+    """
+    if medicines is None:
+        medicines = Medicine.query.filter_by(user_id=user_id).all()
+    now = now or datetime.utcnow()
+
+    counts = taken_counts([m.id for m in medicines if m.adherence_watermark is None])
+    result = {}
+    for m in medicines:
+        slots = m.get_slot_minutes()
+        if not m.start_date or not slots:
+            result[m.id] = 0.0
+            continue
+        end_date = adherence_window_end(m, now)
+        if m.adherence_watermark is None:
+            taken = counts.get(m.id, 0)
+        else:
+            taken = m.taken_count
+        result[m.id] = adherence_percent(m, scheduled_through(m, slots, end_date), taken, end_date)
+    return result
 
 def calculate_adherence(medicine_id):
     """
@@ -12,45 +150,4 @@ def calculate_adherence(medicine_id):
     if not medicine:
         return 0.0
 
-    if not medicine.start_date:
-        return 0.0
-        
-    start_date = medicine.start_date
-    end_date = medicine.end_date if medicine.end_date and medicine.end_date < datetime.utcnow() else datetime.utcnow()
-    
-    # Simple calculation: Count how many times it SHOULD have been taken
-    # This is complex because of "times" array. 
-    # For MVP: Iterate days from start to end and count occurrences
-    
-    times = medicine.get_times_list() # e.g. ["09:00", "21:00"]
-    if not times:
-        return 0.0
-        
-    scheduled_count = 0
-    current_day = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    end_day = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    while current_day <= end_day:
-        for time_str in times:
-            # Parse time
-            try:
-                h, m = map(int, time_str.split(':'))
-                scheduled_time = current_day.replace(hour=h, minute=m)
-                if scheduled_time <= end_date:
-                    scheduled_count += 1
-            except:
-                continue
-        current_day += timedelta(days=1)
-        
-    if scheduled_count == 0:
-        return 100.0 if medicine.start_date <= end_date else 0.0
-
-    # Count actual taken logs
-    # We count ALL taken logs for this medicine. 
-    # Ideally should filter by date range but for now all logs implies within range.
-    taken_count = DoseLog.query.filter_by(medicine_id=medicine_id, taken=True).count()
-    
-    if taken_count > scheduled_count:
-        return 100.0 # Cap at 100
-        
-    return round((taken_count / scheduled_count) * 100, 1)
\ No newline at end of file
+    return calculate_user_adherence(medicine.user_id, [medicine])[medicine.id]
@@ -1,8 +1,14 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for
 from flask_login import login_required, current_user
+from app.models import Appointment, DoseLog, Medicine, ReminderQueue, db
+from app.utils import calculate_user_adherence
+from datetime import datetime, timedelta
 
 main = Blueprint('main', __name__)
 
+SUMMARY_APPOINTMENTS = 5
+SUMMARY_REMINDERS = 5
+
 @main.route('/')
 def index():
     if current_user.is_authenticated:
@@ -12,4 +18,94 @@ def index():
 @main.route('/dashboard')
 @login_required
 def dashboard():
-    return render_template('dashboard.html', user=current_user)
\ No newline at end of file
+    return render_template('dashboard.html', user=current_user)
+
+def todays_doses(medicines, logs, day_start):
+    """
+    Today's scheduled doses per medicine with their taken status. Each taken
+    log marks the nearest still-open slot of its medicine.
+    """
+    logs_by_med = {}
+    for medicine_id, scheduled in logs:
+        logs_by_med.setdefault(medicine_id, []).append(scheduled)
+
+    doses = []
+    for med in medicines:
+        if (med.start_date and med.start_date >= day_start + timedelta(days=1)) or \
+                (med.end_date and med.end_date < day_start):
+            continue
+        slots = [day_start + timedelta(minutes=m) for m in med.get_slot_minutes()]
+        taken = [False] * len(slots)
+        for logged in logs_by_med.get(med.id, []):
+            open_slots = [i for i, t in enumerate(taken) if not t]
+            if not open_slots:
+                break
+            taken[min(open_slots, key=lambda i: abs(slots[i] - logged))] = True
+        doses.extend({
+            'medicine_id': med.id,
+            'name': med.name,
+            'dose': med.dose,
+            'time': slot.strftime('%H:%M'),
+            'taken': done
+        } for slot, done in zip(slots, taken))
+    doses.sort(key=lambda d: d['time'])
+    return doses
+
+@main.route('/api/dashboard/summary')
+@login_required
+def dashboard_summary():
+    """
+    Everything the dashboard shows, from four queries: medicines, today's
+    taken logs, upcoming appointments and pending reminders. Adherence comes
+    from the materialized counters. Supports If-None-Match.
+    """
+    now = datetime.utcnow()
+    day_start = datetime.combine(now.date(), datetime.min.time())
+
+    meds = Medicine.query.filter_by(user_id=current_user.id).all()
+    adherence = calculate_user_adherence(current_user.id, meds, now)
+    med_ids = [m.id for m in meds]
+
+    logs = db.session.query(DoseLog.medicine_id, DoseLog.scheduled_datetime).filter(
+        DoseLog.medicine_id.in_(med_ids),
+        DoseLog.taken == True,
+        DoseLog.scheduled_datetime >= day_start,
+        DoseLog.scheduled_datetime < day_start + timedelta(days=1)
+    ).order_by(DoseLog.scheduled_datetime).all() if med_ids else []
+
+    appts = Appointment.query.filter(
+        Appointment.user_id == current_user.id,
+        Appointment.appointment_datetime >= now,
+        Appointment.status != 'cancelled'
+    ).order_by(Appointment.appointment_datetime).limit(SUMMARY_APPOINTMENTS).all()
+
+    reminders = db.session.query(ReminderQueue.send_at, Medicine.name).join(
+        Medicine, Medicine.id == ReminderQueue.medicine_id
+    ).filter(
+        Medicine.user_id == current_user.id,
+        ReminderQueue.sent == False,
+        ReminderQueue.send_at >= now
+    ).order_by(ReminderQueue.send_at).limit(SUMMARY_REMINDERS).all()
+
+    response = jsonify({
+        'medicines': [{
+            'id': m.id,
+            'name': m.name,
+            'dose': m.dose,
+            'times': m.get_slot_times(),
+            'adherence': adherence[m.id]
+        } for m in meds],
+        'today': todays_doses(meds, logs, day_start),
+        'appointments': [{
+            'id': a.id,
+            'title': a.title,
+            'datetime': a.appointment_datetime.isoformat()
+        } for a in appts],
+        'reminders': [{
+            'medicine': name,
+            'send_at': send_at.isoformat()
+        } for send_at, name in reminders]
+    })
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
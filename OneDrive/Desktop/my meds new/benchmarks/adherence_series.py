@@ -0,0 +1,87 @@
+"""
+Benchmark: vectorized adherence analytics vs. a per-day Python loop.
+
+    python -m benchmarks.adherence_series [--users 200] [--medicines 3] [--years 3]
+
+Builds synthetic multi-year dose histories in an in-memory database, checks
+that the daily series of both implementations agree, then times one
+medicine's series and the cohort report.
+"""
+import argparse
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from app import create_app
+from app.analytics import DoseMatrix, cohort_report, medicine_series
+from app.models import db, DoseLog, Medicine
+from benchmarks.seed import bench_config, seed
+
+def loop_series(med, start, end, now):
+    # The straightforward implementation: walk every day and check each dose time
+    times = med.get_times_list()
+    logs = Counter(log.scheduled_datetime.date() for log in DoseLog.query.filter_by(medicine_id=med.id, taken=True))
+    until = min(med.end_date or now, now)
+    series = []
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day <= end:
+        scheduled = 0
+        if med.start_date.date() <= day.date():
+            for time_str in times:
+                h, m = map(int, time_str.split(':'))
+                if day.replace(hour=h, minute=m) <= until:
+                    scheduled += 1
+        taken = min(logs[day.date()], scheduled)
+        series.append({'period': day.date().isoformat(), 'scheduled': scheduled, 'taken': taken})
+        day += timedelta(days=1)
+    return series
+
+def loop_cohort(start, end, now):
+    totals = Counter()
+    for med in Medicine.query.all():
+        for point in loop_series(med, start, end, now):
+            totals[med.user_id, 'scheduled'] += point['scheduled']
+            totals[med.user_id, 'taken'] += point['taken']
+    return totals
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--medicines', type=int, default=3)
+    parser.add_argument('--years', type=int, default=3)
+    args = parser.parse_args()
+
+    app = create_app(bench_config())
+    with app.app_context():
+        now = datetime.utcnow()
+        started = time.perf_counter()
+        data = seed(args.users, args.medicines, args.years, appointments=0, now=now)
+        print(f"generated {data['dose_logs']} dose logs in {time.perf_counter() - started:.1f}s")
+
+        med = db.session.get(Medicine, 1)
+        start = med.start_date
+        vectorized = DoseMatrix([med], start, now, now).load_logs().series('day')
+        assert [(p['period'], p['scheduled'], p['taken']) for p in vectorized] == \
+            [(p['period'], p['scheduled'], p['taken']) for p in loop_series(med, start, now, now)]
+
+        print(f"{'case':<28} {'ms':>10}")
+        print(f"{'series, per-day loop':<28} {timed(lambda: loop_series(med, start, now, now)):>10.1f}")
+        for bucket in ('day', 'week', 'month'):
+            ms = timed(lambda: medicine_series(med, start, now, bucket, now))
+            print(f"{'series, vectorized ' + bucket:<28} {ms:>10.1f}")
+        cohort_start = now - timedelta(days=89)
+        ms = timed(lambda: loop_cohort(cohort_start, now, now), repeat=1)
+        print(f"{f'cohort 90d, per-day loop':<28} {ms:>10.1f}")
+        ms = timed(lambda: list(cohort_report(cohort_start, now, now=now)), repeat=1)
+        print(f"{f'cohort 90d, vectorized':<28} {ms:>10.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Microbenchmark: compiled KeywordMatcher vs. the original list-scanning chatbot.
+
+    python -m benchmarks.chat_matcher [--sizes 20,1000,5000] [--messages 2000]
+
+For each lexicon size the legacy scan and the automaton are timed on the same
+messages, after checking that both classify every message identically.
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+from app.matcher import KeywordMatcher
+
+BASE = {
+    'crisis': ['suicide', 'kill', 'die', 'harm', 'dead'],
+    'negative': ['sad', 'depressed', 'anxious', 'worried', 'bad', 'panic', 'stress'],
+    'positive': ['happy', 'good', 'great', 'fine', 'better', 'thanks'],
+    'intents': {'info_appt': ['appointment'], 'info_meds': ['medicine', 'pill']},
+}
+
+SAMPLES = [
+    "thanks", "i feel sad", "I am so anxious about my appointment tomorrow",
+    "Did I take my pill this morning?", "feeling great today, much better",
+    "everything is fine", "i want to kill myself", "hello there",
+    "My medicine makes me feel bad and worried", "can you help me book a visit",
+]
+
+def legacy_response(text, lexicon):
+    # The pre-matcher implementation: substring scans plus list membership per word
+    text_lower = text.lower()
+    if any(k in text_lower for k in lexicon['crisis']):
+        return 'crisis', -1.0
+
+    score = 0.0
+    words = re.findall(r'\w+', text_lower)
+    for w in words:
+        if w in lexicon['negative']: score -= 0.5
+        if w in lexicon['positive']: score += 0.5
+    score = max(min(score, 1.0), -1.0)
+
+    for name, terms in lexicon['intents'].items():
+        if any(t in text_lower for t in terms):
+            return name, score
+    return None, score
+
+def compiled_response(text, matcher):
+    crisis, intent, score = matcher.match(text)
+    return ('crisis', -1.0) if crisis else (intent, score)
+
+def grow_lexicon(size, rng):
+    # Pad each category with random filler words that never occur in SAMPLES
+    def filler(n):
+        return [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(7, 12))) + 'qz'
+                for _ in range(n)]
+    extra = max(size - 20, 0) // 4
+    return {
+        'crisis': BASE['crisis'] + filler(extra),
+        'negative': BASE['negative'] + filler(extra),
+        'positive': BASE['positive'] + filler(extra),
+        'intents': {name: terms + filler(extra // len(BASE['intents']))
+                    for name, terms in BASE['intents'].items()},
+    }
+
+def timed(fn, messages, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for m in messages:
+            fn(m)
+        best = min(best, time.perf_counter() - start)
+    return best / len(messages) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='20,1000,5000')
+    parser.add_argument('--messages', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    messages = [rng.choice(SAMPLES) for _ in range(args.messages)]
+
+    print(f"{'terms':>8} {'legacy us/msg':>14} {'compiled us/msg':>16} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        lexicon = grow_lexicon(size, rng)
+        matcher = KeywordMatcher(lexicon['crisis'], lexicon['negative'], lexicon['positive'], lexicon['intents'])
+        for m in SAMPLES:
+            assert legacy_response(m, lexicon) == compiled_response(m, matcher), m
+
+        legacy = timed(lambda m: legacy_response(m, lexicon), messages)
+        compiled = timed(lambda m: compiled_response(m, matcher), messages)
+        print(f"{size:>8} {legacy:>14.2f} {compiled:>16.2f} {legacy / compiled:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+Load benchmark for the API routes and the reminder jobs.
+
+    python -m benchmarks.load [--users 100] [--medicines 3] [--years 1] [--appointments 20]
+                              [--requests 300] [--reminders 1000] [--database PATH]
+                              [--output results.json] [--baseline baseline.json]
+                              [--tolerance 0.2] [--fail-on-regression]
+
+Seeds a fresh database (in memory unless --database is given) through
+create_app with the test config, drives the routes with the Flask test client
+as randomly chosen users and runs the scheduler jobs directly against the
+in-process SMTP sink. Reports latency percentiles, SQL queries per operation
+and throughput; results are written as JSON and can be compared with a
+previous run's file.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select, update
+
+from app import create_app
+from app.models import db, Medicine, ReminderQueue
+from app.reminders import process_reminder_queue, scan_and_queue_reminders
+from benchmarks.seed import bench_config, seed
+
+CHAT_MESSAGES = [
+    "hello", "thanks", "i feel sad", "I am anxious about my appointment",
+    "did I take my pill?", "feeling great today", "everything is fine",
+]
+WARMUP = 5
+# Metrics compared against a baseline; higher is worse for all of them
+COMPARED = ('p50_ms', 'p90_ms', 'queries_per_op')
+
+class QueryCounter:
+    """Counts SQL statements executed on an engine."""
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+def percentile(sorted_samples, q):
+    index = min(len(sorted_samples) - 1, max(0, round(q / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+def summarize(latencies, queries, ops, errors):
+    ordered = sorted(latencies)
+    total = sum(latencies)
+    return {
+        'iterations': len(latencies),
+        'errors': errors,
+        'mean_ms': round(total / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+        'p90_ms': round(percentile(ordered, 90) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'queries_per_op': round(queries / len(latencies), 2),
+        'throughput_per_s': round(ops / total, 1) if total else None,
+    }
+
+def measure(counter, iterations, run, setup=None):
+    """
+    Time `run` for each iteration after an untimed `setup`. `run` returns
+    (ok, ops): ops is the unit of throughput, e.g. one request or N emails.
+    """
+    latencies, queries, ops, errors = [], 0, 0, 0
+    for i in range(iterations):
+        state = setup() if setup else None
+        before = counter.count
+        started = time.perf_counter()
+        ok, done = run(state)
+        latencies.append(time.perf_counter() - started)
+        queries += counter.count - before
+        ops += done
+        errors += not ok
+    return summarize(latencies, queries, ops, errors)
+
+def route_scenarios(app, rng, medicine_ids):
+    client = app.test_client()
+    users = list(medicine_ids)
+
+    def as_random_user():
+        user_id = rng.choice(users)
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return user_id
+
+    def request(method, url_for_user, payload=None):
+        def run(user_id):
+            response = client.open(url_for_user(user_id), method=method, json=payload(user_id) if payload else None)
+            return response.status_code < 400, 1
+        return run
+
+    def dose(user_id):
+        return {'scheduled_datetime': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S'), 'taken': True}
+
+    return {
+        'GET /api/medicines': (as_random_user, request('GET', lambda u: '/api/medicines')),
+        'POST /api/medicines/<id>/log': (as_random_user, request(
+            'POST', lambda u: f'/api/medicines/{rng.choice(medicine_ids[u])}/log', dose)),
+        'GET /api/appointments': (as_random_user, request('GET', lambda u: '/api/appointments')),
+        'GET /api/dashboard/summary': (as_random_user, request('GET', lambda u: '/api/dashboard/summary')),
+        'POST /api/chat': (as_random_user, request(
+            'POST', lambda u: '/api/chat', lambda u: {'message': rng.choice(CHAT_MESSAGES)})),
+    }
+
+def job_scenarios(app, reminders):
+    def clear_queue():
+        with app.app_context():
+            db.session.execute(ReminderQueue.__table__.delete())
+            db.session.commit()
+
+    def scan(_):
+        scan_and_queue_reminders(app)
+        with app.app_context():
+            return True, db.session.query(db.func.count(ReminderQueue.id)).scalar()
+
+    def make_due():
+        # Move a slice of the queue into the past; distinct offsets keep (medicine_id, send_at) unique
+        with app.app_context():
+            now = datetime.utcnow()
+            ids = db.session.scalars(select(ReminderQueue.id).limit(reminders)).all()
+            if not ids:
+                scan_and_queue_reminders(app)
+                ids = db.session.scalars(select(ReminderQueue.id).limit(reminders)).all()
+            db.session.execute(update(ReminderQueue), [
+                {'id': rid, 'send_at': now - timedelta(seconds=n + 1), 'sent': False, 'attempts': 0,
+                 'claimed_by': None, 'claim_expires_at': None}
+                for n, rid in enumerate(ids)])
+            db.session.commit()
+        return len(app.extensions['smtp_sink'].messages) if 'smtp_sink' in app.extensions else 0
+
+    def process(sent_before):
+        process_reminder_queue(app)
+        sent = len(app.extensions['smtp_sink'].messages) - sent_before
+        return sent > 0, sent
+
+    return {
+        'job scan_and_queue_reminders': (clear_queue, scan),
+        'job process_reminder_queue': (make_due, process),
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results, baseline, tolerance):
+    """Print per-metric ratios against a baseline run. Returns the regressed (scenario, metric) pairs."""
+    regressions = []
+    print(f"\n{'scenario':<34} {'metric':<16} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        for metric in COMPARED:
+            old, new = previous.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            # Query counts are deterministic: any increase is a regression
+            limit = 0.0 if metric == 'queries_per_op' else tolerance
+            flag = ' !' if change > limit else ''
+            if flag:
+                regressions.append((name, metric))
+            print(f"{name:<34} {metric:<16} {old:>10} {new:>10} {change:>+7.0%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--medicines', type=int, default=3)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--appointments', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=300, help='timed requests per route')
+    parser.add_argument('--jobs', type=int, default=5, help='timed runs per scheduler job')
+    parser.add_argument('--reminders', type=int, default=1000, help='due reminders per process_reminder_queue run')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database', help='SQLite file to use instead of an in-memory database (recreated)')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed latency increase vs. baseline')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    uri = None
+    if args.database:
+        path = os.path.abspath(args.database)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        uri = 'sqlite:///' + path
+    app = create_app(bench_config(uri))
+    rng = random.Random(args.seed)
+
+    # Requests must not run inside a long-lived app context: it would share g
+    # and the database session across requests
+    with app.app_context():
+        started = time.perf_counter()
+        data = seed(args.users, args.medicines, args.years, args.appointments, seed=args.seed)
+        print(f"seeded {data['dose_logs']} dose logs, {data['appointments']} appointments "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        medicine_ids = defaultdict(list)
+        for med_id, user_id in db.session.query(Medicine.id, Medicine.user_id):
+            medicine_ids[user_id].append(med_id)
+        counter = QueryCounter(db.engine)
+
+    scenarios = [(name, args.requests, s) for name, s in route_scenarios(app, rng, medicine_ids).items()]
+    scenarios += [(name, args.jobs, s) for name, s in job_scenarios(app, args.reminders).items()]
+    results = {}
+    print(f"\n{'scenario':<34} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'queries':>8} {'ops/s':>9} {'errors':>6}")
+    for name, iterations, (setup, run) in scenarios:
+        measure(counter, min(WARMUP, iterations), run, setup)
+        r = results[name] = measure(counter, iterations, run, setup)
+        print(f"{name:<34} {r['p50_ms']:>9.2f} {r['p90_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+              f"{r['queries_per_op']:>8} {r['throughput_per_s'] or 0:>9.1f} {r['errors']:>6}")
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': 'file' if uri else 'memory',
+            'params': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'fail_on_regression')},
+            'data': data,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nwrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
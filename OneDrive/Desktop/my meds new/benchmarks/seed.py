@@ -0,0 +1,90 @@
+"""
+Synthetic data for benchmarks: users with medicines, years of DoseLog history
+and appointments, written with bulk inserts. Deterministic for a given seed.
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app import bcrypt
+from app.config import TestConfig
+from app.models import db, Appointment, DoseLog, Medicine, User
+
+SCHEDULES = [[540], [480, 1200], [480, 840, 1320], [420, 720, 1020, 1320]]
+PASSWORD = 'benchmark'
+FLUSH_EVERY = 50000
+
+def bench_config(database_uri=None, **overrides):
+    """TestConfig, optionally against a file database, with config overrides."""
+    attrs = dict(overrides)
+    if database_uri:
+        attrs['SQLALCHEMY_DATABASE_URI'] = database_uri
+    return type('BenchConfig', (TestConfig,), attrs)
+
+def _flush(rows, model):
+    if rows:
+        db.session.execute(insert(model), rows)
+        rows.clear()
+
+def seed(users=100, medicines=3, years=1, appointments=20, taken_ratio=0.85, seed=42, now=None):
+    """
+    Populate the current app's database. Every user's password is PASSWORD.
+    Returns a summary dict of what was generated.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    start = (now - timedelta(days=365 * years)).replace(hour=0, minute=0, second=0, microsecond=0)
+    # One bcrypt hash shared by everyone: hashing per user would dominate seeding
+    password_hash = bcrypt.generate_password_hash(PASSWORD).decode('utf-8')
+
+    first_user = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    db.session.execute(insert(User), [
+        {'email': f'user{first_user + i}@example.com', 'password_hash': password_hash, 'name': f'User {first_user + i}'}
+        for i in range(users)])
+    user_ids = range(first_user, first_user + users)
+
+    for user_id in user_ids:
+        for n in range(medicines):
+            med = Medicine(user_id=user_id, name=f'Medicine {n + 1}', dose='10mg', start_date=start)
+            med.set_schedule(rng.choice(SCHEDULES))
+            db.session.add(med)
+    db.session.commit()
+
+    logs = []
+    log_count = 0
+    meds = db.session.query(Medicine.id, Medicine.slot_minutes).filter(Medicine.user_id.in_(list(user_ids)))
+    for med_id, slots in meds.all():
+        minutes = [int(m) for m in slots.split(',') if m]
+        day = start
+        while day < now:
+            for minute in minutes:
+                when = day + timedelta(minutes=minute)
+                if when <= now and rng.random() < taken_ratio:
+                    logs.append({'medicine_id': med_id, 'scheduled_datetime': when, 'taken': True, 'logged_at': when})
+                    log_count += 1
+            day += timedelta(days=1)
+        if len(logs) >= FLUSH_EVERY:
+            _flush(logs, DoseLog)
+    _flush(logs, DoseLog)
+
+    appts = []
+    for user_id in user_ids:
+        # Half in the past, half upcoming, on distinct half-hour slots so none overlap
+        for n in range(appointments):
+            begins = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=(n - appointments // 2) * 25)
+            appts.append({
+                'user_id': user_id, 'title': f'Checkup {n + 1}', 'description': '',
+                'appointment_datetime': begins, 'end_datetime': begins + timedelta(minutes=30),
+                'status': 'scheduled', 'created_at': now
+            })
+        if len(appts) >= FLUSH_EVERY:
+            _flush(appts, Appointment)
+    _flush(appts, Appointment)
+    db.session.commit()
+
+    # Adherence counters as the app would have maintained them
+    from app.utils import rebuild_all_adherence_summaries
+    rebuild_all_adherence_summaries()
+    return {'users': users, 'medicines': users * medicines, 'dose_logs': log_count,
+            'appointments': users * appointments, 'years': years}
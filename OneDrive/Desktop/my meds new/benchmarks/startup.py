@@ -0,0 +1,105 @@
+"""
+Benchmark: interpreter-to-app startup time, as paid by every gunicorn worker,
+CLI invocation and test run.
+
+    python -m benchmarks.startup [--runs 10] [--database PATH] [--importtime 15]
+
+Each case runs in a fresh interpreter against a copy of the database. Reports
+the median and best wall time of importing the package, of create_app with and
+without SCHEMA_AUTO_UPGRADE, and of a forced full schema check, plus which
+heavy optional modules ended up imported. --importtime lists the slowest
+imports from `python -X importtime`.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['numpy', 'apscheduler', 'smtplib', 'cProfile']
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+from app import create_app
+application = create_app()
+created = time.perf_counter()
+forced = None
+if {force}:
+    from app.schema import upgrade_schema
+    with application.app_context():
+        upgrade_schema(force=True)
+    forced = time.perf_counter() - created
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'upgrade_ms': forced * 1000 if forced is not None else None,
+    'heavy': [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+CASES = [
+    ('create_app, SCHEMA_AUTO_UPGRADE=true', {'SCHEMA_AUTO_UPGRADE': 'true'}, False),
+    ('create_app, SCHEMA_AUTO_UPGRADE=false', {'SCHEMA_AUTO_UPGRADE': 'false'}, False),
+    ('forced full schema upgrade', {'SCHEMA_AUTO_UPGRADE': 'false'}, True),
+]
+
+def probe(env, force):
+    code = PROBE.format(force=force, heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def importtime(env, top):
+    code = 'from app import create_app; create_app()'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.startswith(' ') and not name.startswith('  '):
+            rows.append((int(cumulative), name.strip()))
+    print(f"\n{'top-level import':<40} {'cumulative ms':>14}")
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"{name:<40} {cumulative / 1000:>14.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--database', default=os.path.join(ROOT, 'instance', 'meditrack.db'),
+                        help='SQLite database to copy for the runs (default: instance/meditrack.db)')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N', help='also list the N slowest imports')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'startup.db')
+        if os.path.exists(args.database):
+            shutil.copy(args.database, path)
+        env = dict(os.environ, DATABASE_URL='sqlite:///' + path, REMINDER_SCHEDULER_IN_APP='false')
+        # Bring the copy up to date once, so the timed runs measure steady-state restarts
+        probe(dict(env, SCHEMA_AUTO_UPGRADE='true'), False)
+
+        print(f"{'case':<40} {'import ms':>10} {'create_app ms':>14} {'best total':>11}  heavy modules")
+        for name, overrides, force in CASES:
+            samples = [probe(dict(env, **overrides), force) for _ in range(args.runs)]
+            key = 'upgrade_ms' if force else 'create_app_ms'
+            totals = [s['import_ms'] + s[key] for s in samples]
+            print(f"{name:<40} {statistics.median(s['import_ms'] for s in samples):>10.1f} "
+                  f"{statistics.median(s[key] for s in samples):>14.1f} {min(totals):>11.1f}  "
+                  f"{', '.join(samples[-1]['heavy']) or '-'}")
+
+        if args.importtime:
+            importtime(dict(env, SCHEMA_AUTO_UPGRADE='false'), args.importtime)
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == '__main__':
+    main()
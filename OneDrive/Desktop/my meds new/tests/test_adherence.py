@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import pytest
+
+from app import create_app
+from app.config import TestConfig
+from app.models import db, DoseLog, Medicine, User
+from app.utils import calculate_user_adherence, rebuild_adherence_summary, record_dose, scheduled_through
+
+@pytest.fixture
+def app():
+    app = create_app(TestConfig)
+    with app.app_context():
+        yield app
+
+def add_medicine(created, start_date, minutes):
+    user = User(email='a@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    med = Medicine(user_id=user.id, name='Aspirin', dose='10mg', start_date=start_date, created_at=created)
+    med.set_schedule(minutes)
+    # As POST /api/medicines does when the medicine is created
+    rebuild_adherence_summary(med, 0, created)
+    db.session.add(med)
+    db.session.commit()
+    return med
+
+def test_future_start_date_counts_from_start_date(app):
+    med = add_medicine(datetime(2026, 1, 1, 12), datetime(2026, 2, 1), [540])
+    now = datetime(2026, 2, 2, 12)
+
+    assert scheduled_through(med, med.get_slot_minutes(), now) == 2
+    for day in (1, 2):
+        log = DoseLog(medicine_id=med.id, scheduled_datetime=datetime(2026, 2, day, 9), taken=True)
+        db.session.add(log)
+        record_dose(med, log, datetime(2026, 2, day, 10))
+        db.session.commit()
+
+    assert med.scheduled_count == 2
+    assert calculate_user_adherence(med.user_id, [med], now)[med.id] == 100.0
+
+def test_summary_matches_closed_form_after_start(app):
+    med = add_medicine(datetime(2026, 1, 10, 8), datetime(2026, 1, 10), [480, 1260])
+    now = datetime(2026, 1, 20, 22)
+
+    # 10 full days of two doses, plus both doses on the 20th
+    assert scheduled_through(med, med.get_slot_minutes(), now) == 22
@@ -0,0 +1,29 @@
+import pytest
+
+from app import create_app
+from app.config import TestConfig
+
+@pytest.fixture
+def client():
+    app = create_app(TestConfig)
+    client = app.test_client()
+    client.post('/register', data={'email': 'a@example.com', 'password': 'pw', 'name': 'A'})
+    client.post('/login', data={'email': 'a@example.com', 'password': 'pw'})
+    return client
+
+@pytest.mark.parametrize('body', [
+    {'appointments': ['x']},
+    {'appointments': {'a': 1}},
+    {'title': 'Therapy', 'datetime': '2026-11-02T10:00', 'repeat': [1]},
+    [1],
+])
+def test_bulk_rejects_malformed_payloads(client, body):
+    response = client.post('/api/appointments/bulk', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+def test_bulk_books_weekly_series(client):
+    response = client.post('/api/appointments/bulk', json={
+        'title': 'Therapy', 'datetime': '2026-11-02T10:00', 'repeat': {'every_days': 7, 'count': 3}})
+    assert response.status_code == 201
+    assert len(response.get_json()['ids']) == 3
@@ -0,0 +1,67 @@
+import smtplib
+
+from app.mailer import Mailer
+
+class StubSMTP:
+    """Records messages; send_message raises the next queued error, if any."""
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+
+    def send_message(self, msg):
+        if self.server.errors:
+            raise self.server.errors.pop(0)
+        self.server.sent.append((id(self), msg['To']))
+
+    def quit(self):
+        self.closed = True
+
+    close = quit
+
+class StubServer:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.sent = []
+        self.connections = []
+
+    def connect(self):
+        conn = StubSMTP(self)
+        self.connections.append(conn)
+        return conn
+
+def mailer(server):
+    return Mailer(server.connect, 'noreply@example.com', pool_size=1, retries=1)
+
+def test_refused_recipient_keeps_connection():
+    server = StubServer([smtplib.SMTPRecipientsRefused({'bad@example.com': (550, b'no such user')})])
+    m = mailer(server)
+
+    assert m.send('bad@example.com', 'subject', 'body') is False
+    assert m.send('good@example.com', 'subject', 'body') is True
+    assert len(server.connections) == 1
+    assert not server.connections[0].closed
+    assert server.sent == [(id(server.connections[0]), 'good@example.com')]
+
+def test_data_error_is_not_retried():
+    server = StubServer([smtplib.SMTPDataError(554, b'rejected')])
+    m = mailer(server)
+
+    assert m.send('a@example.com', 'subject', 'body') is False
+    assert len(server.connections) == 1
+    assert server.sent == []
+
+def test_disconnect_retries_on_fresh_connection():
+    server = StubServer([smtplib.SMTPServerDisconnected('gone')])
+    m = mailer(server)
+
+    assert m.send('a@example.com', 'subject', 'body') is True
+    assert len(server.connections) == 2
+    assert server.connections[0].closed
+    assert server.sent == [(id(server.connections[1]), 'a@example.com')]
+
+def test_socket_error_retries_on_fresh_connection():
+    server = StubServer([ConnectionResetError('reset')])
+    m = mailer(server)
+
+    assert m.send('a@example.com', 'subject', 'body') is True
+    assert len(server.connections) == 2
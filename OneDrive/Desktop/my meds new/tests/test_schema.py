@@ -0,0 +1,61 @@
+import sqlite3
+
+from app import create_app
+from app.config import TestConfig
+from app.models import db, DoseLog, Medicine, ReminderQueue, User
+
+# Tables as created by the first release, before any column or index was added
+PRE_SERIES_SCHEMA = """
+CREATE TABLE user (
+    id INTEGER NOT NULL, email VARCHAR(120) NOT NULL, password_hash VARCHAR(128) NOT NULL,
+    name VARCHAR(100), created_at DATETIME NOT NULL, PRIMARY KEY (id));
+CREATE UNIQUE INDEX ix_user_email ON user (email);
+CREATE TABLE medicine (
+    id INTEGER NOT NULL, user_id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, dose VARCHAR(50) NOT NULL,
+    times VARCHAR(500) NOT NULL, start_date DATETIME, end_date DATETIME, created_at DATETIME NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id));
+CREATE TABLE appointment (
+    id INTEGER NOT NULL, user_id INTEGER NOT NULL, title VARCHAR(100) NOT NULL, description VARCHAR(255),
+    appointment_datetime DATETIME NOT NULL, status VARCHAR(20) NOT NULL, created_at DATETIME NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id));
+CREATE TABLE dose_log (
+    id INTEGER NOT NULL, medicine_id INTEGER NOT NULL, scheduled_datetime DATETIME NOT NULL,
+    taken BOOLEAN NOT NULL, logged_at DATETIME NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(medicine_id) REFERENCES medicine (id));
+CREATE TABLE reminder_queue (
+    id INTEGER NOT NULL, medicine_id INTEGER NOT NULL, send_at DATETIME NOT NULL,
+    sent BOOLEAN NOT NULL, attempts INTEGER NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(medicine_id) REFERENCES medicine (id));
+"""
+
+def pre_series_database(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(PRE_SERIES_SCHEMA)
+    created = '2025-01-01 00:00:00.000000'
+    for user_id in (1, 2, 3):
+        conn.execute('INSERT INTO user VALUES (?, ?, ?, ?, ?)',
+                     (user_id, f'user{user_id}@example.com', 'x', f'User {user_id}', created))
+        conn.execute('INSERT INTO medicine VALUES (?, ?, ?, ?, ?, ?, NULL, ?)',
+                     (user_id, user_id, 'Aspirin', '10mg', '["09:00", "21:00"]', created, created))
+        conn.execute('INSERT INTO dose_log VALUES (?, ?, ?, 1, ?)',
+                     (user_id, user_id, '2025-01-02 09:00:00.000000', created))
+    # The same reminder queued twice, as the pre-series planner could do
+    for reminder_id in (1, 2):
+        conn.execute('INSERT INTO reminder_queue VALUES (?, 1, ?, 0, 0)', (reminder_id, '2025-01-02 09:00:00.000000'))
+    conn.commit()
+    conn.close()
+
+def test_upgrade_keeps_every_user(tmp_path):
+    path = tmp_path / 'pre_series.db'
+    pre_series_database(str(path))
+    config = type('UpgradeConfig', (TestConfig,), {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    app = create_app(config)
+
+    with app.app_context():
+        assert [u.id for u in User.query.order_by(User.id)] == [1, 2, 3]
+        assert all(u.calendar_token is None for u in User.query)
+        assert Medicine.query.count() == 3
+        assert DoseLog.query.count() == 3
+        assert db.session.get(Medicine, 2).get_slot_minutes() == [540, 1260]
+        # Real duplicates are still collapsed before the unique index is created
+        assert [r.id for r in ReminderQueue.query] == [1]
@@ -0,0 +1,11 @@
+import logging
+from app import create_app
+from app.config import WorkerConfig
+from app.reminders import run_worker
+
+app = create_app(WorkerConfig)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # Start as many of these as needed; reminders are leased per worker
+    run_worker(app)